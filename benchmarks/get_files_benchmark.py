@@ -0,0 +1,83 @@
+"""
+Compare the serial and threaded directory walkers behind `get_files` on a
+deep synthetic tree. Pass `--root` to benchmark an existing directory instead
+(e.g. on an NFS / Lustre mount, where the threaded walker matters most).
+`--latency` adds an artificial delay to every directory read to emulate one
+
+    python benchmarks/get_files_benchmark.py --depth 5 --branching 4 --files 20 --latency 2
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from pathlib import Path
+from upyog.os import read_files
+from upyog.os.read_files import get_files
+
+
+def make_tree(root: Path, depth: int, branching: int, files: int) -> int:
+    "Create a tree with `branching` subdirs per level and `files` files per dir"
+    num_files = 0
+    dirs = [root]
+    for level in range(depth + 1):
+        next_dirs = []
+        for d in dirs:
+            d.mkdir(parents=True, exist_ok=True)
+            for i in range(files):
+                (d / f"{i}.jpg").touch()
+            num_files += files
+            if level < depth:
+                next_dirs += [d / f"d{j}" for j in range(branching)]
+        dirs = next_dirs
+    return num_files
+
+
+def timeit(fn, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, default=None)
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--branching", type=int, default=4)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8, 16])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0, help="Per-directory delay in ms")
+    args = parser.parse_args()
+
+    if args.latency:
+        scandir = read_files._scandir
+
+        def slow_scandir(path):
+            time.sleep(args.latency / 1000)
+            return scandir(path)
+
+        read_files._scandir = slow_scandir
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(args.root) if args.root else Path(tmp)
+        if not args.root:
+            n = make_tree(root, args.depth, args.branching, args.files)
+            print(f"Created {n} files in {root}")
+
+        expected = sorted(get_files(root, recurse=True))
+        serial = timeit(lambda: get_files(root, recurse=True), args.repeats)
+        print(f"serial       : {serial:.3f}s ({len(expected)} files)")
+
+        for w in args.workers:
+            assert sorted(get_files(root, recurse=True, workers=w)) == expected
+            t = timeit(lambda: get_files(root, recurse=True, workers=w), args.repeats)
+            print(f"workers={w:<4}: {t:.3f}s ({serial / t:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
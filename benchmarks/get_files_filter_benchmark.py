@@ -0,0 +1,81 @@
+"""
+Micro-benchmark of the per-directory filtering done by `get_files`, comparing
+the previous implementation (a `Path` per entry, suffix parsed with `split`,
+extensions lowercased for every directory) against the current one
+
+    python benchmarks/get_files_filter_benchmark.py --files 200000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from pathlib import Path
+from upyog.os.read_files import _IMAGE_EXTENSIONS, _get_files, _normalise_extensions, get_files
+
+
+def _get_files_previous(parent, p, f, extensions) -> list:
+    p = Path(p)
+    if isinstance(extensions, str):
+        extensions = [extensions]
+    low_extensions = [e.lower() for e in extensions] if extensions is not None else None
+    res = [
+        p / o
+        for o in f
+        if not o.startswith(".")
+        and (extensions is None or f'.{o.split(".")[-1].lower()}' in low_extensions)
+    ]
+    return res
+
+
+def timeit(fn, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=200_000)
+    parser.add_argument("--dirs", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    suffixes = [".jpg", ".JPEG", ".png", ".txt", ".json", ".url.txt"]
+    per_dir = args.files // args.dirs
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for d in range(args.dirs):
+            folder = os.path.join(tmp, f"{d:04d}")
+            os.mkdir(folder)
+            for i in range(per_dir):
+                open(os.path.join(folder, f"{i:07d}{suffixes[i % len(suffixes)]}"), "w").close()
+
+        listings = []
+        for d in sorted(os.listdir(tmp)):
+            with os.scandir(os.path.join(tmp, d)) as it:
+                listings.append(list(it))
+        names = [(os.path.join(tmp, d), [e.name for e in entries]) for d, entries in zip(sorted(os.listdir(tmp)), listings)]
+
+        for label, exts in [("no extensions", None), ("image extensions", _IMAGE_EXTENSIONS)]:
+            print(f"---- {args.files} files, {label} ----")
+            previous = timeit(lambda: [_get_files_previous(tmp, p, f, exts) for p, f in names], args.repeats)
+            print(f"previous        : {previous:.3f}s")
+
+            low = _normalise_extensions(exts)
+            for return_type in ["path", "str", "entry"]:
+                t = timeit(lambda: [_get_files(p, e, low, return_type) for (p, _), e in zip(names, listings)], args.repeats)
+                print(f"return_type={return_type:<5}: {t:.3f}s ({previous / t:.2f}x)")
+
+        print(f"---- end to end get_files(recurse=True), {args.files} files ----")
+        for return_type in ["path", "str", "entry"]:
+            t = timeit(lambda: get_files(tmp, recurse=True, extensions=_IMAGE_EXTENSIONS, return_type=return_type), args.repeats)
+            print(f"return_type={return_type:<5}: {t:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Compare the threaded and asyncio engines of `img-downloader` against a local
+stand-in HTTP server that serves the same JPEG for every URL. `--latency` adds
+a delay to every response to emulate remote image hosts, which is where keeping
+many more requests in flight pays off. The async engine decodes / re-encodes on
+`--decode_workers` processes, so give it a machine with a few cores
+
+    python benchmarks/img_downloader_benchmark.py --n 2000 --latency 50 --threads 32 --concurrency 512
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from PIL import Image
+from upyog.image.img_downloader import download_image, download_images_async
+
+
+def make_handler(image: bytes, latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(image)))
+            self.end_headers()
+            self.wfile.write(image)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(image: bytes, latency: float, port_queue: multiprocessing.Queue):
+    "Run in its own process, so that the server doesn't compete with the downloader for the GIL"
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(image, latency))
+    server.daemon_threads = True
+    server.request_queue_size = 4096
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def make_url_files(folder: Path, n: int, port: int):
+    folder.mkdir(parents=True)
+    for i in range(n):
+        (folder / f"{i:07d}.url.txt").write_text(f"http://127.0.0.1:{port}/{i}.jpg")
+    return sorted(folder.glob("*.url.txt"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=256, help="Width / height of the served image")
+    parser.add_argument("--latency", type=float, default=50, help="Per-request delay in ms")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=512)
+    parser.add_argument("--decode_workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    buf = io.BytesIO()
+    Image.effect_noise((args.size, args.size), 64).convert("RGB").save(buf, format="JPEG")
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(buf.getvalue(), args.latency / 1000, port_queue), daemon=True)
+    server.start()
+    port = port_queue.get()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        url_files = make_url_files(tmp / "urls", args.n, port)
+
+        (tmp / "threads").mkdir()
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.threads) as executor:
+            results = list(executor.map(lambda f: download_image(f, tmp / "threads"), url_files))
+        threads = time.perf_counter() - start
+        assert all(r.success for r in results)
+        print(f"threads={args.threads:<5}    : {threads:.2f}s ({args.n / threads:.0f} images/s)")
+
+        (tmp / "async").mkdir()
+        start = time.perf_counter()
+        # Every URL is on the same (local) host, so don't cap connections per host
+        results = asyncio.run(download_images_async(
+            url_files, tmp / "async", concurrency=args.concurrency, limit_per_host=args.concurrency,
+            decode_workers=args.decode_workers,
+        ))
+        t = time.perf_counter() - start
+        assert all(r.success for r in results)
+        print(f"async concurrency={args.concurrency:<5}: {t:.2f}s ({args.n / t:.0f} images/s, {threads / t:.2f}x)")
+
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
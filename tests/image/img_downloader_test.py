@@ -0,0 +1,77 @@
+import asyncio
+import io
+import threading
+import time
+
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+from upyog.image.img_downloader import download_image, download_images_async
+
+pytest.importorskip("aiohttp")
+
+
+@pytest.fixture
+def server():
+    buf = io.BytesIO()
+    Image.new("RGB", (16, 16), "red").save(buf, format="PNG")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if "slow" in self.path:
+                time.sleep(0.1)
+            data = buf.getvalue() if self.path.endswith(".png") else b"not found"
+            self.send_response(200 if self.path.endswith(".png") else 404)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_download_images_async(tmp_path, server):
+    url_files = []
+    for name in ["a.png", "b.png", "missing.jpg"]:
+        url_file = tmp_path / f"{name.split('.')[0]}.url.txt"
+        url_file.write_text(f"{server}/{name}")
+        url_files.append(url_file)
+    out = tmp_path / "out"
+    out.mkdir()
+    assert download_image(url_files[0], out).success
+
+    results = asyncio.run(download_images_async(url_files, out, max_retries=1, concurrency=2))
+    results = {r.url_file.name: r for r in results}
+    assert results["a.url.txt"].reason == "File already exists"
+    assert results["b.url.txt"].success and results["b.url.txt"].reason is None
+    assert not results["missing.url.txt"].success and "404" in results["missing.url.txt"].reason
+    assert Image.open(out / "b.jpg").size == (16, 16)
+
+
+def test_download_images_async_resize(tmp_path, server):
+    (tmp_path / "a.url.txt").write_text(f"{server}/a.png")
+    results = asyncio.run(download_images_async(
+        [tmp_path / "a.url.txt"], tmp_path, decode_workers=1, write_workers=1, queue_size=1, max_size=8,
+    ))
+    assert results[0].success
+    assert Image.open(tmp_path / "a.jpg").size == (8, 8)
+    assert not list(tmp_path.glob("*.partial"))
+
+
+def test_download_images_async_queued_requests_dont_time_out(tmp_path, server):
+    # Each request takes 0.1s and only one runs at a time, so most wait longer than `timeout`
+    url_files = []
+    for i in range(8):
+        (tmp_path / f"{i}.url.txt").write_text(f"{server}/slow-{i}.png")
+        url_files.append(tmp_path / f"{i}.url.txt")
+    results = asyncio.run(download_images_async(
+        url_files, tmp_path, max_retries=1, concurrency=8, limit_per_host=1, timeout=0.3,
+    ))
+    assert all(r.success for r in results), [r.reason for r in results if not r.success]
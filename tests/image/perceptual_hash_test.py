@@ -0,0 +1,49 @@
+import random
+import numpy as np
+
+from PIL import Image
+from upyog.image.perceptual_hash import (
+    BKTree, _dct_matrix, average_hash, difference_hash, find_near_duplicate_images, hamming_distance, perceptual_hash,
+)
+
+
+def test_bktree_matches_brute_force():
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(16) for _ in range(500)]
+    tree = BKTree(hashes)
+
+    for query in hashes[:50]:
+        expected = sorted(h for h in set(hashes) if hamming_distance(query, h) <= 3)
+        assert sorted(h for _, h in tree.search(query, 3)) == expected
+
+
+def _make_image(seed: int, size: int = 512) -> Image.Image:
+    "Smooth random blobs, so that the image survives resizing / re-encoding"
+    rng = np.random.default_rng(seed)
+    noise = Image.fromarray(rng.integers(0, 256, (8, 8, 3), dtype=np.uint8))
+    return noise.resize((size, size), Image.Resampling.BICUBIC)
+
+
+def test_dct_matrix_is_orthonormal():
+    D = _dct_matrix(32)
+    assert np.allclose(D @ D.T, np.eye(32))
+
+
+def test_find_near_duplicate_images(tmp_path):
+    # Large JPEGs, so that `_load_reduced` decodes them with `draft`
+    _make_image(0).save(tmp_path / "original.jpg", quality=95)
+    _make_image(0).resize((300, 300)).save(tmp_path / "resized.jpg", quality=60)
+    _make_image(1).save(tmp_path / "unrelated.png")
+    files = [tmp_path / f for f in ["original.jpg", "resized.jpg", "unrelated.png"]]
+
+    for hash_fn in [average_hash, difference_hash, perceptual_hash]:
+        original, resized, unrelated = [hash_fn(f) for f in files]
+        assert hamming_distance(original, resized) <= 4
+        assert hamming_distance(original, unrelated) > 10
+        # Hashing an already loaded image skips `draft`, which barely changes the hash
+        assert hamming_distance(hash_fn(Image.open(files[0])), original) <= 4
+
+    for method in ["ahash", "dhash", "phash"]:
+        clusters, file2hash = find_near_duplicate_images(files, method, workers=1, verbose=False)
+        assert [sorted(c) for c in clusters] == [files[:2]]
+        assert set(file2hash) == set(files)
@@ -0,0 +1,30 @@
+from upyog.os.cli import _filename_overlap_matrix, remove_duplicates_from_folder
+
+
+def test_filename_overlap_matrix():
+    overlap = _filename_overlap_matrix([
+        ["1.jpg", "2.jpg", "3.jpg"],
+        ["3.jpg", "1.jpg", "4.jpg", "1.jpg"],
+        ["3.jpg"],
+    ])
+    assert overlap.tolist() == [
+        [3, 2, 1],
+        [2, 3, 1],
+        [1, 1, 1],
+    ]
+
+
+def test_remove_duplicates_from_folder_by_content(tmp_path):
+    inputs, targets = tmp_path / "inputs", tmp_path / "inputs" / "targets"
+    targets.mkdir(parents=True)
+    (targets / "a.jpg").write_bytes(b"a" * 100)
+    (targets / "b.jpg").write_bytes(b"b" * 100)
+    (inputs / "renamed-a.jpg").write_bytes(b"a" * 100)  # Same content, different name
+    (inputs / "b.jpg").write_bytes(b"c" * 100)          # Same name, different content
+
+    # `targets` is inside `inputs` too, but files in a target folder are never deleted
+    remove_duplicates_from_folder.__wrapped__(i=str(inputs), t=[str(targets)], by="content", workers=2)
+    assert sorted(p.relative_to(inputs).as_posix() for p in inputs.rglob("*.jpg")) == [
+        "b.jpg", "targets/a.jpg", "targets/b.jpg"
+    ]
+    assert (inputs / "b.jpg").read_bytes() == b"c" * 100
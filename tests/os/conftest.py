@@ -0,0 +1,33 @@
+import io
+import tarfile
+
+import pytest
+
+
+def _make_tar(path, members):
+    "Write `{member name: bytes}` to the uncompressed tar file `path`"
+    with tarfile.open(path, "w") as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+def _make_shard(path, keys, suffixes=(".jpg", ".txt", ".url.txt"), data=None):
+    """
+    A WebDataset-style shard with a `{key}{suffix}` member for every key and suffix.
+    `data(key, suffix)` gives the contents, by default the member name repeated 100 times
+    """
+    data = data or (lambda key, suffix: f"{key}{suffix}".encode() * 100)
+    return _make_tar(path, {f"{key}{suffix}": data(key, suffix) for key in keys for suffix in suffixes})
+
+
+@pytest.fixture
+def make_tar():
+    return _make_tar
+
+
+@pytest.fixture
+def make_shard():
+    return _make_shard
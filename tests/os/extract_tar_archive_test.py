@@ -0,0 +1,79 @@
+from upyog.os.extract_tar_archive import extract_and_organize_tarfiles, extract_tarfile
+
+
+STRUCTURE = {".jpg": "jpg__data", ".txt": "txt__data", ".url.txt": "url_txt__data"}
+
+
+def test_extract_tarfile(tmp_path, make_shard):
+    shard = make_shard(tmp_path / "00000.tar", ["a", "b"])
+    out = tmp_path / "out"
+    for subdir in STRUCTURE.values():
+        (out / subdir).mkdir(parents=True)
+
+    result = extract_tarfile(shard, out, {".jpg": "jpg__data", ".txt": "txt__data"})
+    assert (out / "jpg__data" / "a.jpg").read_bytes() == b"a.jpg" * 100
+    assert sorted(p.name for p in (out / "txt__data").iterdir()) == ["a.txt", "b.txt"]
+    assert (result.extracted, result.bytes) == (4, 2000)
+    assert len(result.messages) == 2 and "Unexpected suffix '.url.txt'" in result.messages[0]
+
+    result = extract_tarfile(shard, out, STRUCTURE)
+    assert (out / "url_txt__data" / "b.url.txt").exists()
+    assert result.extracted == 2
+    assert not list(out.rglob("*.partial"))
+
+
+def test_extract_and_organize_tarfiles(tmp_path, make_shard):
+    make_shard(tmp_path / "00000.tar", ["a", "b"])
+    make_shard(tmp_path / "00001.tar", ["c"])
+    out = tmp_path / "out"
+
+    (tmp_path / "00002.tar").write_bytes(b"not a tar file")
+
+    extract_and_organize_tarfiles.__wrapped__(tmp_path, output_dir=out, workers=2)
+    for subdir in STRUCTURE.values():
+        assert len(list((out / subdir).iterdir())) == 3
+    assert (out / "url_txt__data" / "c.url.txt").read_bytes() == b"c.url.txt" * 100
+
+
+def test_extraction_manifest(tmp_path, make_shard):
+    from upyog.os.extract_tar_archive import EXTRACTION_MANIFEST, load_extraction_manifest
+
+    shards = [make_shard(tmp_path / "00000.tar", ["a", "b"]), make_shard(tmp_path / "00001.tar", ["c"])]
+    out = tmp_path / "out"
+    extract_and_organize_tarfiles.__wrapped__(tmp_path, output_dir=out)
+
+    done = load_extraction_manifest(out / EXTRACTION_MANIFEST)
+    assert sorted(done) == [str(s) for s in shards]
+    assert done[str(shards[0])]["members"] == 6
+
+    # Unchanged shards aren't opened again, changed ones are extracted again
+    (out / "jpg__data" / "a.jpg").unlink()
+    make_shard(shards[1], ["c", "d"])
+    extract_and_organize_tarfiles.__wrapped__(tmp_path, output_dir=out)
+    assert not (out / "jpg__data" / "a.jpg").exists()
+    assert (out / "jpg__data" / "d.jpg").exists()
+    assert load_extraction_manifest(out / EXTRACTION_MANIFEST)[str(shards[1])]["members"] == 6
+
+
+def test_detect_structure_from_tarfiles(tmp_path, make_shard):
+    from upyog.os.extract_tar_archive import detect_structure_from_tarfiles
+
+    shards = [make_shard(tmp_path / f"{i:05d}.tar", [f"k{i}"]) for i in range(3)]
+    make_shard(shards[2], ["k2"], suffixes=(".jpg", ".txt", ".url.txt", ".json"))
+
+    assert detect_structure_from_tarfiles(shards) == STRUCTURE
+    assert detect_structure_from_tarfiles(shards, num_samples=3) == {**STRUCTURE, ".json": "json__data"}
+
+
+def test_extract_same_member_names_concurrently(tmp_path, make_shard):
+    from upyog.os.extract_tar_archive import EXTRACTION_MANIFEST, load_extraction_manifest
+
+    for i in range(4):
+        make_shard(tmp_path / f"{i:05d}.tar", ["a", "b"], data=lambda key, suffix: key.encode() * 1_000_000)
+    out = tmp_path / "out"
+    extract_and_organize_tarfiles.__wrapped__(tmp_path, output_dir=out, force_overwrite=True, workers=4)
+
+    # Failed shards aren't recorded in the manifest
+    assert len(load_extraction_manifest(out / EXTRACTION_MANIFEST)) == 4
+    assert (out / "jpg__data" / "a.jpg").read_bytes() == b"a" * 1_000_000
+    assert not list(out.rglob("*.partial"))
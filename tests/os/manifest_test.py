@@ -0,0 +1,31 @@
+from pathlib import Path
+from upyog.os.manifest import FileManifest
+from upyog.os.read_files import collate_image_filenames
+
+
+def test_manifest_matches_list(tmp_path):
+    files = [Path(p) for p in ["b/x.jpg", "a/b-c.jpg", "a/b/x.jpg", "a/b/x.jpg", "a/a.jpg", "/abs/z.png", "x.jpg", "b.jpg", "/ab.jpg"]]
+    manifest = FileManifest.from_paths(files, chunk_size=2)
+
+    assert len(manifest) == len(files)
+    assert list(manifest) == files
+    assert manifest[2] == files[2] and manifest[-1] == files[-1]
+    assert list(manifest[1:3]) == files[1:3]
+
+    assert manifest.num_unique() == len(set(files))
+    assert list(manifest.sort()) == sorted(files)
+    assert list(manifest.dedupe()) == sorted(set(files))
+
+    manifest.save(tmp_path / "manifest.parquet")
+    loaded = FileManifest.load(tmp_path / "manifest.parquet", return_str=True)
+    assert list(loaded) == [str(f) for f in sorted(set(files))]
+
+
+def test_collate_image_filenames_manifest(tmp_path):
+    for f in ["1.jpg", "sub/2.png", "sub/3.txt"]:
+        (tmp_path / f).parent.mkdir(exist_ok=True)
+        (tmp_path / f).write_bytes(b"")
+
+    expected = collate_image_filenames(["x/4.jpg"], [tmp_path])
+    manifest = collate_image_filenames(["x/4.jpg"], [tmp_path], return_manifest=True)
+    assert list(manifest) == expected
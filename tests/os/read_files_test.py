@@ -0,0 +1,130 @@
+import os
+import types
+
+from pathlib import Path
+from upyog.os.read_files import get_files, iter_files, get_image_files
+
+
+def make_tree(root: Path):
+    files = [
+        "a.jpg", "b.PNG", "notes.txt",
+        "sub1/c.jpg", "sub1/deep/d.jpeg", "sub1/deep/e.txt",
+        "sub2/f.png", ".hidden/g.jpg", "sub2/.h.jpg",
+    ]
+    for f in files:
+        f = root / f
+        f.parent.mkdir(parents=True, exist_ok=True)
+        f.write_bytes(b"")
+    return root
+
+
+def test_iter_files_matches_get_files(tmp_path):
+    root = make_tree(tmp_path)
+
+    for kwargs in [
+        dict(recurse=True),
+        dict(recurse=False),
+        dict(recurse=True, extensions=[".jpg", ".png"]),
+        dict(recurse=True, include=["sub1"]),
+        dict(recurse=True, exclude=["sub1"]),
+    ]:
+        expected = get_files(root, **kwargs)
+        lazy = get_files(root, lazy=True, **kwargs)
+        assert isinstance(lazy, types.GeneratorType)
+        assert sorted(lazy) == sorted(expected)
+        assert sorted(iter_files(root, **kwargs)) == sorted(expected)
+
+
+def test_get_image_files_multiple_paths(tmp_path):
+    root = make_tree(tmp_path)
+    files = get_image_files([root / "sub1", root / "sub2"])
+    assert sorted(f.name for f in files) == ["c.jpg", "d.jpeg", "f.png"]
+
+
+def test_parallel_walk_matches_serial(tmp_path):
+    root = make_tree(tmp_path)
+
+    for kwargs in [dict(), dict(include=["sub1"]), dict(exclude=["sub2"])]:
+        serial = get_files(root, recurse=True, **kwargs)
+        parallel = get_files(root, recurse=True, workers=4, **kwargs)
+        assert sorted(parallel) == sorted(serial)
+
+
+def test_file_listing_cache(tmp_path):
+    from upyog.os.file_index import FileListingCache, _MTIME_GRACE_NS
+
+    root = make_tree(tmp_path / "data")
+    # Backdate directory mtimes so that they are trusted by the cache
+    old = os.stat(root).st_mtime_ns - 2 * _MTIME_GRACE_NS
+    for p, d, f in os.walk(root):
+        os.utime(p, ns=(old, old))
+
+    with FileListingCache(tmp_path / "index.sqlite") as cache:
+        expected = sorted(get_files(root, recurse=True))
+        assert sorted(get_files(root, recurse=True, cache=cache)) == expected
+        assert cache.hits == 0
+
+        assert sorted(get_files(root, recurse=True, cache=cache, workers=4)) == expected
+        assert cache.misses == cache.hits
+
+        (root / "sub1" / "new.jpg").write_bytes(b"")
+        assert sorted(get_files(root, recurse=True, cache=cache)) == sorted(expected + [root / "sub1" / "new.jpg"])
+
+
+def test_return_type(tmp_path):
+    root = make_tree(tmp_path)
+    paths = get_files(root, recurse=True, extensions=[".JPG", ".png"])
+    assert sorted(get_files(root, recurse=True, extensions=[".JPG", ".png"], return_type="str")) == sorted(map(str, paths))
+    entries = get_files(root, recurse=True, extensions=".jpg", return_type="entry")
+    assert sorted(Path(e.path) for e in entries) == sorted(p for p in paths if p.suffix == ".jpg")
+
+
+def test_sniff_image_files(tmp_path):
+    from PIL import Image
+
+    Image.new("RGB", (4, 4)).save(tmp_path / "real.jpg")
+    Image.new("RGB", (4, 4)).save(tmp_path / "no_extension", format="PNG")
+    Image.new("RGB", (4, 4)).save(tmp_path / "misnamed.png", format="WEBP")
+    Image.new("RGB", (4, 4)).save(tmp_path / "real.bmp")
+    (tmp_path / "fake.jpg").write_text("not an image")
+    (tmp_path / "fake.bmp").write_text("BM is also how this text starts")
+
+    all_images = ["fake.bmp", "fake.jpg", "misnamed.png", "real.bmp", "real.jpg"]
+    assert sorted(f.name for f in get_image_files(tmp_path)) == all_images
+    assert sorted(f.name for f in get_image_files(tmp_path, sniff=True)) == [
+        "misnamed.png", "no_extension", "real.bmp", "real.jpg"
+    ]
+
+
+def test_prune_and_max_depth(tmp_path):
+    import re
+
+    root = make_tree(tmp_path)
+    (root / "sub2" / "cache").mkdir()
+    (root / "sub2" / "cache" / "x.jpg").write_bytes(b"")
+
+    names = lambda files: sorted(f.name for f in files)
+    assert "x.jpg" in names(get_files(root, recurse=True))
+    assert "x.jpg" not in names(get_files(root, recurse=True, prune="cache"))
+    assert "x.jpg" not in names(get_files(root, recurse=True, prune="cach*"))
+    assert "x.jpg" not in names(get_files(root, recurse=True, prune=re.compile(r"c\w+"), workers=4))
+    assert names(get_files(root, recurse=True, prune=["deep", "sub2"])) == ["a.jpg", "b.PNG", "c.jpg", "notes.txt"]
+    assert names(get_files(root, recurse=True, max_depth=0)) == ["a.jpg", "b.PNG", "notes.txt"]
+    assert names(get_files(root, recurse=True, max_depth=1)) == ["a.jpg", "b.PNG", "c.jpg", "f.png", "notes.txt"]
+
+
+def test_count_files_matches_get_files(tmp_path):
+    from upyog.os.disk_usage import count_files, count_files_in_subfolders
+
+    root = make_tree(tmp_path)
+    (root / "sub1" / "c.jpg").write_bytes(b"123")
+
+    assert count_files(root).files == len(get_files(root, recurse=True))
+    assert count_files(root, recurse=False).files == len(get_files(root, recurse=False))
+    assert count_files(root, [".jpg", ".png"], workers=4).files == len(get_files(root, [".jpg", ".png"], recurse=True))
+
+    counts = count_files_in_subfolders(root, with_bytes=True, workers=2)
+    assert list(counts) == [".hidden", "sub1", "sub2"]
+    assert counts["sub1"].files == len(get_files(root / "sub1", recurse=True))
+    assert counts["sub1"].bytes == 3
+    assert counts["sub1"].extensions == {".jpg": [1, 3], ".jpeg": [1, 0], ".txt": [1, 0]}
@@ -0,0 +1,23 @@
+from upyog.os.shard_manifests import write_shard_manifests, load_shard_manifest
+from upyog.os.utils import load_json
+
+
+def test_write_shard_manifests(tmp_path):
+    root = tmp_path / "data"
+    for i in range(50):
+        f = root / f"{i % 5}" / f"{i}.jpg"
+        f.parent.mkdir(parents=True, exist_ok=True)
+        f.write_bytes(b"x" * i)
+
+    for balance in ["count", "size"]:
+        write_shard_manifests(root, tmp_path / balance, num_shards=4, balance=balance)
+        shards = [load_shard_manifest(tmp_path / balance, i, 4, return_str=True) for i in range(4)]
+        all_files = sorted(f for shard in shards for f in shard)
+        assert all_files == sorted(str(p) for p in root.rglob("*.jpg"))
+
+        # Same assignment on a re-run
+        write_shard_manifests(root, tmp_path / balance, num_shards=4, balance=balance)
+        assert [list(s) for s in shards] == [list(load_shard_manifest(tmp_path / balance, i, 4, True)) for i in range(4)]
+
+    summary = load_json(tmp_path / "size" / "shards.json")
+    assert sum(s["num_bytes"] for s in summary["shards"]) == sum(range(50))
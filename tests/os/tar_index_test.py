@@ -0,0 +1,28 @@
+import os
+
+import pytest
+from upyog.os.tar_index import build_tar_index, tar_index_path, TarMemberReader, _is_index_current
+
+
+def test_tar_member_reader(tmp_path, make_tar):
+    members = {"a.jpg": os.urandom(1000), "sub/b.txt": b"hello", "empty.bin": b""}
+    shard = make_tar(tmp_path / "shard.tar", members)
+
+    assert not _is_index_current(shard)
+    assert build_tar_index(shard) == tar_index_path(shard) == tmp_path / "shard.tar.index.parquet"
+    assert _is_index_current(shard)
+
+    with TarMemberReader(shard) as reader:
+        assert len(reader) == 3 and "sub/b.txt" in reader
+        for name, data in members.items():
+            view = reader[name]
+            assert isinstance(view, memoryview) and view == data
+            view.release()
+
+    with TarMemberReader(shard, use_mmap=False) as reader:
+        assert reader.read("a.jpg") == members["a.jpg"]
+
+    make_tar(shard, {"c.jpg": b"changed"})
+    assert not _is_index_current(shard)
+    with pytest.raises(ValueError):
+        TarMemberReader(shard)
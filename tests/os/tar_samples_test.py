@@ -0,0 +1,50 @@
+import io
+import json
+
+from PIL import Image
+from upyog.os.tar_samples import TarSampleReader, iter_tar_samples, split_key
+
+
+SUFFIXES = (".jpg", ".json", ".url.txt")
+
+
+def sample_data(key, suffix):
+    if suffix == ".jpg":
+        img = io.BytesIO()
+        Image.new("RGB", (8, 8), "red").save(img, format="JPEG")
+        return img.getvalue()
+    return b'{"a": 1}' if suffix == ".json" else key.encode()
+
+
+def test_split_key():
+    assert split_key("0001/abc.url.txt") == ("0001/abc", ".url.txt")
+    assert split_key("abc") == ("abc", "")
+
+
+def test_iter_tar_samples(tmp_path, make_shard):
+    shard = make_shard(tmp_path / "00000.tar", ["a", "b"], SUFFIXES, sample_data)
+
+    samples = list(iter_tar_samples(shard))
+    assert [s["__key__"] for s in samples] == ["a", "b"]
+    assert set(samples[0]) == {"__key__", "__shard__", "jpg__data", "json__data", "url_txt__data"}
+    assert samples[1]["url_txt__data"] == b"b"
+
+    samples = list(iter_tar_samples(shard, {".jpg": "image", ".url.txt": "url"}, decode=True))
+    assert set(samples[0]) == {"__key__", "__shard__", "image", "url"}
+    assert samples[0]["image"].size == (8, 8) and samples[0]["url"] == "a"
+
+
+def test_tar_sample_reader(tmp_path, make_shard):
+    shards = [make_shard(tmp_path / f"{i:05d}.tar", [f"{i}-a", f"{i}-b"], SUFFIXES, sample_data) for i in range(4)]
+
+    reader = TarSampleReader(shards, rank=0, world_size=1)
+    assert [s["__key__"] for s in reader][:3] == ["0-a", "0-b", "1-a"]
+
+    keys = set()
+    for rank in range(2):
+        reader = TarSampleReader(shards, shuffle_shards=True, seed=1, rank=rank, world_size=2)
+        reader.set_epoch(3)
+        assert len(reader.worker_shards()) == 2
+        keys |= {s["__key__"] for s in reader}
+    assert len(keys) == 8
+    assert json.loads(next(iter(reader))["json__data"]) == {"a": 1}
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from upyog.os.tar_index import TarMemberReader
+from upyog.os.tar_samples import iter_tar_samples
+from upyog.os.tar_writer import write_tar_shards
+
+
+def test_write_tar_shards(tmp_path):
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    for key in ["0001", "0002", "0003", "sub/0004"]:
+        (src / f"{key}.jpg").write_bytes(os.urandom(400))
+        (src / f"{key}.url.txt").write_bytes(key.encode())
+
+    out = tmp_path / "shards"
+    shards = write_tar_shards(src, out, shard_size=900, workers=2, verbose=False)
+    assert [s.num_samples for s in shards] == [2, 2]
+    assert [s.path.name for s in shards] == ["shard-000000.tar", "shard-000001.tar"]
+
+    samples = [s for shard in shards for s in iter_tar_samples(shard.path)]
+    assert [s["__key__"] for s in samples] == ["0001", "0002", "0003", "sub/0004"]
+    assert samples[3]["jpg__data"] == (src / "sub" / "0004.jpg").read_bytes()
+
+    with TarMemberReader(shards[1].path, use_mmap=False) as reader:
+        assert reader["sub/0004.url.txt"] == b"sub/0004"
+
+    assert all(s.skipped for s in write_tar_shards(src, out, shard_size=900, verbose=False))
+
+
+def test_write_tar_shards_multiple_roots(tmp_path):
+    # e.g. the subfolders written by `extract-and-organise-tar-archive`
+    for folder, suffix in [("jpg__data", ".jpg"), ("url_txt__data", ".url.txt")]:
+        (tmp_path / folder).mkdir()
+        for key in ["0001", "0002"]:
+            (tmp_path / folder / f"{key}{suffix}").write_bytes(key.encode())
+
+    roots = [tmp_path / "jpg__data", tmp_path / "url_txt__data"]
+    shards = write_tar_shards(roots, tmp_path / "shards", verbose=False)
+    samples = list(iter_tar_samples(shards[0].path))
+    assert [sorted(s) for s in samples] == [["__key__", "__shard__", "jpg__data", "url_txt__data"]] * 2
+
+    # The same file name in two roots would be lost in the tar file
+    (tmp_path / "url_txt__data" / "0001.jpg").write_bytes(b"other")
+    with pytest.raises(ValueError, match="0001.jpg"):
+        write_tar_shards(roots, tmp_path / "more-shards", verbose=False)
+
+
+def test_write_tar_shards_after_adding_a_file(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "shards"
+    src.mkdir()
+    for key in ["0002", "0003", "0004"]:
+        (src / f"{key}.jpg").write_bytes(os.urandom(400))
+    shards = write_tar_shards(src, out, shard_size=900, verbose=False)
+    assert [s.num_samples for s in shards] == [2, 1]
+
+    # Moves every shard boundary, so no shard can be reused
+    (src / "0001.jpg").write_bytes(os.urandom(400))
+    shards = write_tar_shards(src, out, shard_size=900, verbose=False)
+    assert [(s.num_samples, s.skipped) for s in shards] == [(2, False), (2, False)]
+    assert [[s["__key__"] for s in iter_tar_samples(shard.path)] for shard in shards] == [
+        ["0001", "0002"], ["0003", "0004"]
+    ]
+    with TarMemberReader(shards[1].path) as reader:
+        assert reader.names() == ["0003.jpg", "0004.jpg"]
+
+    assert all(s.skipped for s in write_tar_shards(src, out, shard_size=900, verbose=False))
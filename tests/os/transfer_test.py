@@ -0,0 +1,58 @@
+import os
+
+from upyog.os.transfer import transfer_files
+
+
+def test_transfer_files(tmp_path):
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    files = [src / "a.bin", src / "sub" / "b.bin", src / "empty.bin"]
+    for i, f in enumerate(files):
+        f.write_bytes(os.urandom(1000 * i))
+
+    out = tmp_path / "out"
+    journal = tmp_path / "journal.jsonl"
+    stats = transfer_files(files[:2], out, journal=journal, workers=2, batch_size=1, verbose=False)
+    assert (stats.files, stats.new, stats.bytes) == (2, 2, 1000)
+    assert (out / "b.bin").read_bytes() == files[1].read_bytes()
+
+    stats = transfer_files(iter(files), out, journal=journal, verbose=False)
+    assert (stats.files, stats.new, stats.skipped) == (1, 1, 2)
+
+    # The journal only skips files sent to the same destination with the same mode
+    stats = transfer_files(files, tmp_path / "elsewhere", journal=journal, verbose=False)
+    assert (stats.files, stats.skipped) == (3, 0)
+    stats = transfer_files(files, out, mode="reflink", journal=journal, verbose=False)
+    assert (stats.files, stats.skipped) == (3, 0)
+
+    stats = transfer_files(files, out, mode="hardlink", verbose=False)
+    assert (stats.files, stats.new) == (3, 0)
+    assert os.path.samefile(out / "a.bin", files[0])
+    assert transfer_files(files, out, mode="hardlink", verbose=False).skipped == 3
+
+    stats = transfer_files(files, tmp_path / "moved", mode="move", verbose=False)
+    assert stats.files == 3 and not files[0].exists()
+    assert (tmp_path / "moved" / "b.bin").read_bytes() == (out / "b.bin").read_bytes()
+
+
+def test_transfer_files_reflink(tmp_path):
+    # Falls back to a regular copy on filesystems without reflinks
+    (tmp_path / "a.bin").write_bytes(os.urandom(5000))
+    stats = transfer_files([tmp_path / "a.bin"], tmp_path / "out", mode="reflink", verbose=False)
+    assert stats.bytes == 5000
+    assert (tmp_path / "out" / "a.bin").read_bytes() == (tmp_path / "a.bin").read_bytes()
+
+
+def test_transfer_files_same_name(tmp_path):
+    # Files with the same name from different folders, copied concurrently
+    files = []
+    for i in range(8):
+        (tmp_path / str(i)).mkdir()
+        files.append(tmp_path / str(i) / "a.bin")
+        files[-1].write_bytes(bytes([i]) * 1_000_000)
+
+    out = tmp_path / "out"
+    stats = transfer_files(files, out, workers=8, batch_size=1, verbose=False)
+    assert (stats.files, stats.new) == (8, 1)
+    assert os.listdir(out) == ["a.bin"]
+    assert (out / "a.bin").read_bytes() in {f.read_bytes() for f in files}
@@ -0,0 +1,54 @@
+import json
+import os
+
+from PIL import Image
+from upyog.os.utils import check_corrupted_images
+
+
+def test_check_corrupted_images(tmp_path):
+    Image.effect_noise((256, 256), 64).convert("RGB").save(tmp_path / "ok.jpg")
+    data = (tmp_path / "ok.jpg").read_bytes()
+    (tmp_path / "truncated.jpg").write_bytes(data[: len(data) // 2])
+    (tmp_path / "garbage.jpg").write_bytes(b"not an image")
+    files = [tmp_path / f for f in ["ok.jpg", "truncated.jpg", "garbage.jpg"]]
+
+    assert check_corrupted_images(files, verbose=False) == files[2:]
+    assert check_corrupted_images(files, verbose=False, full_decode=True, workers=2, batch_size=1) == files[1:]
+
+    journal = tmp_path / "journal.jsonl"
+    assert check_corrupted_images(files[:2], verbose=False, full_decode=True, journal=journal) == files[1:2]
+    assert check_corrupted_images(files, verbose=False, full_decode=True, journal=journal) == files[1:]
+    assert len(journal.read_text().splitlines()) == 3
+    assert json.loads(journal.read_text().splitlines()[-1])["path"] == str(files[2])
+
+    # A header-only scan doesn't vouch for files in a later full scan
+    journal = tmp_path / "header-only.jsonl"
+    assert check_corrupted_images(files, verbose=False, journal=journal) == files[2:]
+    assert check_corrupted_images(files, verbose=False, full_decode=True, journal=journal) == files[1:]
+    # ... but a full scan's results are reused by header-only scans
+    assert check_corrupted_images(files, verbose=False, journal=journal) == files[1:]
+
+
+def test_get_file_size_and_disk_usage(tmp_path):
+    from upyog.os.disk_usage import disk_usage, iter_disk_usage
+    from upyog.os.utils import get_file_size
+
+    (tmp_path / "a" / "deep").mkdir(parents=True)
+    (tmp_path / "b").mkdir()
+    (tmp_path / "a" / "1.jpg").write_bytes(b"x" * 100)
+    (tmp_path / "a" / "deep" / "2.png").write_bytes(b"x" * 50)
+    (tmp_path / "top.txt").write_bytes(b"x" * 10)
+    os.link(tmp_path / "a" / "1.jpg", tmp_path / "b" / "1-link.jpg")
+
+    assert get_file_size(tmp_path, "B") == 260
+    assert get_file_size(tmp_path, "B", workers=None, dedupe_hardlinks=True) == 160
+    assert get_file_size(tmp_path / "top.txt", "B") == 10
+
+    usage = disk_usage(tmp_path, workers=4)
+    assert (usage.files, usage.bytes) == (4, 160)
+    assert {k: (c.files, c.bytes) for k, c in usage.subdirs.items()}["."] == (1, 10)
+    # The hardlinked file's bytes go to whichever of its folders is read first
+    assert usage.subdirs["a"].files == 2
+    assert usage.subdirs["a"].bytes + usage.subdirs["b"].bytes == 150
+    assert usage.extensions[".jpg"][0] == 2
+    assert len(list(iter_disk_usage(tmp_path))) == 4
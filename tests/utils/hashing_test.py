@@ -0,0 +1,59 @@
+import hashlib
+import os
+
+from upyog.utils import hashing
+from upyog.utils.hashing import HashCache, find_duplicate_files, hash_file, hash_files
+
+
+def test_hash_files(tmp_path):
+    data = {f"{i}.bin": os.urandom(i * 1000) for i in range(5)}
+    files = []
+    for name, content in data.items():
+        (tmp_path / name).write_bytes(content)
+        files.append(tmp_path / name)
+
+    assert hash_file(files[3], "md5", chunk_size=1024) == hashlib.md5(data["3.bin"]).hexdigest()
+    assert hash_file(files[3], "sha256", max_bytes=10) == hashlib.sha256(data["3.bin"][:10]).hexdigest()
+
+    expected = {f: hashlib.blake2b(data[f.name]).hexdigest() for f in files}
+    assert hash_files(files, workers=2, verbose=False) == expected
+
+    with HashCache(tmp_path / "hashes.sqlite") as cache:
+        assert hash_files(files, cache=cache, verbose=False) == expected
+        assert hash_files(files, cache=cache, verbose=False) == expected
+        assert (cache.hits, cache.misses) == (5, 5)
+
+        files[0].write_bytes(b"changed")
+        assert hash_files(files, cache=cache, verbose=False)[files[0]] == hashlib.blake2b(b"changed").hexdigest()
+        assert cache.misses == 6
+
+
+def test_find_duplicate_files(tmp_path):
+    big = os.urandom(100_000)
+    contents = {
+        "a.bin": big, "b.bin": big, "c.bin": big[:-1] + b"x",  # same size & start as a/b
+        "d.txt": b"small", "e.txt": b"small", "f.txt": b"other",
+    }
+    for name, content in contents.items():
+        (tmp_path / name).write_bytes(content)
+
+    groups = find_duplicate_files(sorted(tmp_path.iterdir()), partial_bytes=1024, verbose=False)
+    assert sorted(sorted(f.name for f in g) for g in groups) == [["a.bin", "b.bin"], ["d.txt", "e.txt"]]
+
+
+def test_find_duplicate_files_group_filter(tmp_path, monkeypatch):
+    for name, content in {"a.bin": b"same", "b.bin": b"same", "c.txt": b"texts", "d.txt": b"texts"}.items():
+        (tmp_path / name).write_bytes(content)
+
+    hashed = []
+    def spy_hash_files(files, *args, **kwargs):
+        hashed.extend(os.path.basename(f) for f in files)
+        return hash_files(files, *args, **kwargs)
+    monkeypatch.setattr(hashing, "hash_files", spy_hash_files)
+
+    # Same-size groups rejected by `group_filter` are never hashed
+    groups = find_duplicate_files(
+        sorted(tmp_path.iterdir()), verbose=False, group_filter=lambda g: all(f.suffix == ".bin" for f in g)
+    )
+    assert [sorted(f.name for f in g) for g in groups] == [["a.bin", "b.bin"]]
+    assert sorted(set(hashed)) == ["a.bin", "b.bin"]
@@ -4,3 +4,4 @@ from .draw import *
 from .composition import *
 from .visualiser import *
 from .utils import *
+from .perceptual_hash import *
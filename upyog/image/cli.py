@@ -4,6 +4,7 @@ from upyog.os import *
 from upyog.utils import *
 from upyog.cli import *
 from upyog.cli import Param as P
+from upyog.image.perceptual_hash import find_near_duplicate_images, near_duplicates_to_df
 
 
 @call_parse
@@ -84,3 +85,43 @@ def make_grid_from_files(files, ncol, size_WH, sample=None, shuffle=False, N=Non
 
     imgs = [load_image(fn) for fn in files]
     return make_img_grid(imgs, ncol, size_WH, pad=True)
+
+
+@call_parse
+def find_near_duplicate_images_in_folders(
+    # fmt: off
+    i: P("An arbitrary number of inputs folders", str, nargs="+") = None,
+    o: P("Output file for the clusters (.csv or .parquet)", str) = "near-duplicates.csv",
+    method: P("Perceptual hash to use", str, choices=["ahash", "dhash", "phash"]) = "phash",
+    hash_size: P("Hash size. The hash has `hash_size**2` bits", int) = 8,
+    max_distance: P("Max. Hamming distance between hashes of near duplicates", int) = 4,
+    workers: P("No. of processes used to hash images", int) = os.cpu_count(),
+    # fmt: on
+):
+    """
+            --------- NEAR DUPLICATE IMAGE FINDER ---------
+
+    Finds clusters of near duplicate images (re-encodes, resizes, slight
+    edits) across the input folders using perceptual hashes, and saves
+    them with one row per image: `cluster`, `file`, `hash`.
+
+     Usage
+    -------
+
+    find-near-duplicate-images                  \\
+        --i inp-folder-1  inp-folder-2          \\
+        --o near-duplicates.parquet             \\
+        --max_distance 6
+    """
+    files = get_image_files([Path(p) for p in i], workers=workers)
+    clusters, file2hash = find_near_duplicate_images(
+        files, method=method, hash_size=hash_size, max_distance=max_distance, workers=workers
+    )
+    df = near_duplicates_to_df(clusters, file2hash)
+
+    o = Path(o)
+    if o.suffix == ".parquet": df.to_parquet(o, index=False)
+    else:                      df.to_csv(o, index=False)
+
+    rich.print(f"Found {len(clusters)} clusters with {len(df)} images in total. Saved to {o}")
+    return df
@@ -1,3 +1,4 @@
+import asyncio
 import concurrent.futures
 import os
 import time
@@ -5,7 +6,7 @@ import time
 from dataclasses import asdict, dataclass
 from io import BytesIO
 from pathlib import Path
-from typing import Union
+from typing import Callable, List, Optional, Tuple, Union
 from urllib.parse import urlparse
 
 
@@ -16,9 +17,11 @@ from PIL import Image
 from tqdm import tqdm
 from rich import print
 from upyog.cli import P, call_parse
+from upyog.imports import is_package_available
 
 
 PathLike = Union[str, Path]
+IS_AIOHTTP_AVAILABLE = is_package_available("aiohttp")
 
 
 @dataclass
@@ -28,11 +31,72 @@ class DownloadResult:
     reason: Union[str, None]
 
 
+def _url_file_stem(url_file: Path) -> str:
+    return url_file.stem.replace(".url", "")
+
+
+def _encode_image(
+    image_data: bytes, convert_rgb: bool, max_size: Optional[int] = None
+) -> Tuple[Optional[bytes], str]:
+    """
+    Decode the downloaded `image_data`, convert it to RGB / resize it so that its
+    longest side is at most `max_size`, and re-encode it.
+    Returns `(encoded bytes, file extension)`, or `(None, reason)` if that failed
+    """
+    try:
+        image = Image.open(BytesIO(image_data))
+    except:
+        return None, "Invalid image data"
+
+    try:
+        format = image.format
+        if convert_rgb:
+            image = image.convert("RGB")
+            format, extension = "JPEG", "jpg"
+        else:
+            extension = format.lower()
+            if extension in ["jpeg", ""]:
+                extension = "jpg"
+        if max_size is not None and max(image.size) > max_size:
+            image.thumbnail((max_size, max_size))
+
+        buf = BytesIO()
+        image.save(buf, format=format)
+        return buf.getvalue(), extension
+
+    except Exception as e:
+        return None, str(e)
+
+
+def _write_file(path: Path, data: bytes):
+    "Write via a `.partial` file, so a file that exists (and is skipped on re-runs) is always complete"
+    partial_path = path.with_name(path.name + ".partial")
+    partial_path.write_bytes(data)
+    os.replace(partial_path, path)
+
+
+def _save_image_data(
+    image_data: bytes, url_file: Path, output_path: Path, convert_rgb: bool, max_size: Optional[int] = None
+) -> DownloadResult:
+    "Decode the downloaded `image_data` and save it in `output_path`"
+    data, extension = _encode_image(image_data, convert_rgb, max_size)
+    if data is None:
+        return DownloadResult(url_file, False, extension)
+
+    try:
+        _write_file(output_path / f"{_url_file_stem(url_file)}.{extension}", data)
+    except Exception as e:
+        return DownloadResult(url_file, False, str(e))
+
+    return DownloadResult(url_file, True, None)
+
+
 def download_image(
     url_file: PathLike,
     output_path: PathLike,
     convert_rgb: bool = True,
     max_retries: int = 3,
+    max_size: Optional[int] = None,
 ) -> DownloadResult:
     """
     Download an image from a URL and save it to the output path.
@@ -42,6 +106,7 @@ def download_image(
         output_path: Path to the output directory.
         convert_rgb: Whether to convert the image to RGB format (default: True).
         max_retries: Maximum number of retries in case of download failure (default: 3).
+        max_size: (Optional) Downscale images so that their longest side is at most this.
 
     Returns:
         A DownloadResult object containing the URL file path, success status, and error reason (if any).
@@ -51,7 +116,7 @@ def download_image(
     
     # Determine the potential file name
     extension = "jpg" if convert_rgb else "png"  # Default to png if not converting to RGB
-    file_name = output_path / f"{url_file.stem.replace('.url', '')}.{extension}"
+    file_name = output_path / f"{_url_file_stem(url_file)}.{extension}"
     
     # Check if the file already exists
     if file_name.exists():
@@ -66,27 +131,7 @@ def download_image(
             response = requests.get(url, timeout=10)
             response.raise_for_status()
 
-            image_data = response.content
-            try:
-                image = Image.open(BytesIO(image_data))
-            except:
-                return DownloadResult(url_file, False, "Invalid image data")
-
-            try:
-                if convert_rgb:
-                    image = image.convert("RGB")
-                else:
-                    extension = image.format.lower()
-                    if extension in ["jpeg", ""]:
-                        extension = "jpg"
-                    file_name = output_path / f"{url_file.stem.replace('.url', '')}.{extension}"
-
-                image.save(file_name)
-
-            except Exception as e:
-                return DownloadResult(url_file, False, str(e))
-
-            return DownloadResult(url_file, True, None)
+            return _save_image_data(response.content, url_file, output_path, convert_rgb, max_size)
 
         except requests.exceptions.RequestException as e:
             retries += 1
@@ -97,20 +142,161 @@ def download_image(
             return DownloadResult(url_file, False, str(e))
 
 
+async def _fetch_image_async(
+    session, url_file: Path, output_path: Path, convert_rgb: bool, max_retries: int
+) -> Union[bytes, DownloadResult]:
+    "The image data at the URL in `url_file`, or a `DownloadResult` if it's already downloaded / failed"
+    import aiohttp
+
+    file_name = output_path / f"{_url_file_stem(url_file)}.{'jpg' if convert_rgb else 'png'}"
+    if file_name.exists():
+        return DownloadResult(url_file, True, "File already exists")
+
+    try:
+        url = url_file.read_text().strip()
+    except Exception as e:
+        return DownloadResult(url_file, False, str(e))
+
+    for retry in range(1, max_retries + 1):
+        try:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                return await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if retry == max_retries:
+                return DownloadResult(url_file, False, str(e) or type(e).__name__)
+        except Exception as e:
+            return DownloadResult(url_file, False, str(e))
+
+
+async def download_images_async(
+    url_files: List[PathLike],
+    output_path: PathLike,
+    convert_rgb: bool = True,
+    max_retries: int = 3,
+    concurrency: int = 1024,
+    limit_per_host: int = 64,
+    timeout: float = 10,
+    decode_workers: int = os.cpu_count(),
+    write_workers: int = 8,
+    queue_size: int = 256,
+    max_size: Optional[int] = None,
+    on_result: Optional[Callable[[DownloadResult], None]] = None,
+) -> List[DownloadResult]:
+    """
+    Asyncio engine for `download_images`, as a pipeline of three stages connected
+    by queues of at most `queue_size` images, so memory stays flat:
+    1. Fetch: `concurrency` requests in flight over a single `aiohttp` session that
+       keeps connections alive and pools them per host (at most `limit_per_host` each)
+    2. Decode / convert / resize (see `max_size`) / re-encode on a pool of
+       `decode_workers` processes, so the GIL-bound work doesn't throttle fetching
+    3. Write on a pool of `write_workers` threads
+    A request times out when connecting or reading stalls for `timeout` seconds; time
+    spent queued for a connection doesn't count. `on_result` is called with each
+    `DownloadResult` as it completes
+    """
+    if not IS_AIOHTTP_AVAILABLE:
+        raise ImportError("The async downloader requires `aiohttp`. Install it with `pip install aiohttp`")
+    import aiohttp
+
+    output_path = Path(output_path)
+    url_files = iter(url_files)
+    loop = asyncio.get_running_loop()
+    decode_queue = asyncio.Queue(maxsize=queue_size)
+    write_queue = asyncio.Queue(maxsize=queue_size)
+    num_decoders = decode_workers * 2  # Keeps the process pool busy while results are handed on
+    results = []
+
+    def report(result: DownloadResult):
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+
+    # A fixed no. of fetchers pulling from `url_files` keeps memory flat for any no. of files
+    async def fetch(session):
+        for url_file in url_files:
+            url_file = Path(url_file)
+            image_data = await _fetch_image_async(session, url_file, output_path, convert_rgb, max_retries)
+            if isinstance(image_data, DownloadResult):
+                report(image_data)
+            else:
+                await decode_queue.put((url_file, image_data))
+
+    async def decode(decode_pool):
+        while True:
+            item = await decode_queue.get()
+            if item is None:
+                return
+            url_file, image_data = item
+            try:
+                data, extension = await loop.run_in_executor(
+                    decode_pool, _encode_image, image_data, convert_rgb, max_size
+                )
+            except Exception as e:  # e.g. a crashed worker process
+                data, extension = None, str(e)
+            if data is None:
+                report(DownloadResult(url_file, False, extension))
+            else:
+                await write_queue.put((url_file, output_path / f"{_url_file_stem(url_file)}.{extension}", data))
+
+    async def write(write_pool):
+        while True:
+            item = await write_queue.get()
+            if item is None:
+                return
+            url_file, file_name, data = item
+            try:
+                await loop.run_in_executor(write_pool, _write_file, file_name, data)
+                report(DownloadResult(url_file, True, None))
+            except Exception as e:
+                report(DownloadResult(url_file, False, str(e)))
+
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=limit_per_host, ttl_dns_cache=300)
+    # `total` would also count the time spent waiting for a pooled connection, so only
+    # time out on network stalls i.e. connecting or waiting for data for `timeout` seconds
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=decode_workers) as decode_pool, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=write_workers) as write_pool:
+        decoders = [asyncio.create_task(decode(decode_pool)) for _ in range(num_decoders)]
+        writers = [asyncio.create_task(write(write_pool)) for _ in range(write_workers)]
+
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+            await asyncio.gather(*[fetch(session) for _ in range(concurrency)])
+
+        # Shut the stages down in order, once everything before them is done
+        for _ in decoders:
+            await decode_queue.put(None)
+        await asyncio.gather(*decoders)
+        for _ in writers:
+            await write_queue.put(None)
+        await asyncio.gather(*writers)
+
+    return results
+
+
 @call_parse
 def download_images(
     i: P("Input folder with url .txt files") = None,  # type: ignore
     o: P("Output folder") = None,  # type: ignore
     max_threads: P("Max. no. of threads", int) = os.cpu_count(), # type: ignore
     max_retries: P("No. of times to retry downloading an image if we fail", int) = 2, # type: ignore
+    engine: P("'threads' (one blocking request per thread) or 'async' (asyncio + aiohttp). 'auto' picks 'async' if `aiohttp` is installed", str, choices=["auto", "threads", "async"]) = "auto", # type: ignore
+    concurrency: P("Max. no. of requests in flight with the async engine", int) = 1024, # type: ignore
+    limit_per_host: P("Max. no. of connections per host with the async engine", int) = 64, # type: ignore
+    decode_workers: P("No. of processes decoding / re-encoding images with the async engine", int) = os.cpu_count(), # type: ignore
+    write_workers: P("No. of threads writing images with the async engine", int) = 8, # type: ignore
+    max_size: P("(Optional) Downscale images so that their longest side is at most this", int) = None, # type: ignore
 ):
     """
-    Download images from URL files in a folder using multi-threading.
+    Download images from URL files in a folder using multi-threading, or asyncio.
 
     Args:
         folder_path: Path to the input folder containing URL files.
         output_path: Path to the output folder for saving downloaded images.
         max_threads: Maximum number of threads to use for downloading.
+        engine: 'async' keeps thousands of requests in flight over pooled keep-alive connections,
+            and decodes / re-encodes images in a separate pool of processes.
     """
     assert i
     assert o
@@ -128,22 +314,33 @@ def download_images(
     start_time = time.time()
     convert_rgb = True  # NOTE: Hard-coded for now.
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_threads) as executor:
-        futures = [
-            executor.submit(download_image, url_file, output_path, convert_rgb, max_retries)
-            for url_file in url_files
-        ]
-
-        with tqdm(
-            total=total_files, unit="file", desc="Processing images"
-        ) as progress:
-            for future in concurrent.futures.as_completed(futures):
-                result = future.result()
-                progress.update(1)
-                progress.set_postfix_str(
-                    f"{progress.n}/{total_files} ({progress.n / total_files * 100:.2f}%)"
-                )
-                results.append(result)
+    if engine == "auto":
+        engine = "async" if IS_AIOHTTP_AVAILABLE else "threads"
+    print(f"Downloading {total_files} images with the '{engine}' engine")
+
+    with tqdm(total=total_files, unit="file", desc="Processing images") as progress:
+
+        def on_result(result: DownloadResult):
+            progress.update(1)
+            progress.set_postfix_str(
+                f"{progress.n}/{total_files} ({progress.n / total_files * 100:.2f}%)"
+            )
+            results.append(result)
+
+        if engine == "async":
+            asyncio.run(download_images_async(
+                url_files, output_path, convert_rgb, max_retries,
+                concurrency=concurrency, limit_per_host=limit_per_host, decode_workers=decode_workers,
+                write_workers=write_workers, max_size=max_size, on_result=on_result,
+            ))
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_threads) as executor:
+                futures = [
+                    executor.submit(download_image, url_file, output_path, convert_rgb, max_retries, max_size)
+                    for url_file in url_files
+                ]
+                for future in concurrent.futures.as_completed(futures):
+                    on_result(future.result())
     end_time = time.time()
     total_time = end_time - start_time
 
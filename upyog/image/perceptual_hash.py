@@ -0,0 +1,194 @@
+from upyog.imports import *
+from concurrent.futures import ProcessPoolExecutor
+
+
+__all__ = [
+    "average_hash", "difference_hash", "perceptual_hash", "compute_image_hashes",
+    "hamming_distance", "BKTree", "find_near_duplicate_images", "near_duplicates_to_df",
+]
+
+
+def _load_reduced(fn: PathLike, size_WH: Tuple[int, int]) -> Image.Image:
+    """
+    Load `fn` as a greyscale image of `size_WH`. For JPEGs, `draft` makes the decoder
+    downscale while decoding (DCT scaling), which skips most of the decoding work
+    """
+    img = Image.open(fn)
+    img.draft("L", size_WH)
+    return img.convert("L").resize(size_WH, Image.Resampling.BILINEAR)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big")
+
+
+def average_hash(img: Union[PathLike, Image.Image], hash_size: int = 8) -> int:
+    "aHash: each bit is whether a pixel is brighter than the mean"
+    if not isinstance(img, Image.Image): img = _load_reduced(img, (hash_size, hash_size))
+    else:                                img = img.convert("L").resize((hash_size, hash_size), Image.Resampling.BILINEAR)
+    px = np.asarray(img, dtype=np.float32)
+    return _bits_to_int(px > px.mean())
+
+
+def difference_hash(img: Union[PathLike, Image.Image], hash_size: int = 8) -> int:
+    "dHash: each bit is whether a pixel is brighter than its left neighbour"
+    size_WH = (hash_size + 1, hash_size)
+    if not isinstance(img, Image.Image): img = _load_reduced(img, size_WH)
+    else:                                img = img.convert("L").resize(size_WH, Image.Resampling.BILINEAR)
+    px = np.asarray(img, dtype=np.float32)
+    return _bits_to_int(px[:, 1:] > px[:, :-1])
+
+
+@functools.lru_cache(maxsize=8)
+def _dct_matrix(n: int) -> np.ndarray:
+    "Orthonormal DCT-II matrix, so that the 2D DCT of `x` is `D @ x @ D.T`"
+    k = np.arange(n)[:, None]
+    D = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    D[0] /= np.sqrt(2)
+    return D
+
+
+def perceptual_hash(img: Union[PathLike, Image.Image], hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    "pHash: each bit is whether a low frequency DCT coefficient is above the median"
+    n = hash_size * highfreq_factor
+    if not isinstance(img, Image.Image): img = _load_reduced(img, (n, n))
+    else:                                img = img.convert("L").resize((n, n), Image.Resampling.BILINEAR)
+    D = _dct_matrix(n)
+    dct = D @ np.asarray(img, dtype=np.float64) @ D.T
+    lowfreq = dct[:hash_size, :hash_size]
+    return _bits_to_int(lowfreq > np.median(lowfreq))
+
+
+_HASH_FUNCTIONS = {"ahash": average_hash, "dhash": difference_hash, "phash": perceptual_hash}
+
+
+def _hash_image(fn: PathLike, method: str, hash_size: int) -> Optional[int]:
+    try:
+        return _HASH_FUNCTIONS[method](fn, hash_size)
+    except Exception:
+        return None
+
+
+def compute_image_hashes(
+    files: List[PathLike],
+    method: Literal["ahash", "dhash", "phash"] = "phash",
+    hash_size: int = 8,
+    workers: Optional[int] = None,
+    verbose: bool = True,
+) -> List[Optional[int]]:
+    """
+    Compute the perceptual hash of each of `files` in a process pool of `workers`.
+    Hashes are `hash_size**2` bit ints; files that can't be loaded get `None`
+    """
+    if method not in _HASH_FUNCTIONS:
+        raise ValueError(f"Expected `method` to be one of {list(_HASH_FUNCTIONS)}, got '{method}'")
+
+    fn = partial(_hash_image, method=method, hash_size=hash_size)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(tqdm(
+            executor.map(fn, files, chunksize=64), total=len(files), desc="Hashing images", disable=not verbose
+        ))
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over ints with the Hamming distance, to find all
+    hashes within a distance of a query without comparing it to every hash
+    """
+
+    def __init__(self, items: Iterable[int] = ()):
+        # Each node is `[item, {distance: child_node}]`
+        self.root = None
+        for item in items:
+            self.add(item)
+
+    def add(self, item: int):
+        if self.root is None:
+            self.root = [item, {}]
+            return
+
+        node = self.root
+        while True:
+            d = hamming_distance(item, node[0])
+            if d == 0:
+                return
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = [item, {}]
+                return
+            node = child
+
+    def search(self, item: int, max_distance: int) -> List[Tuple[int, int]]:
+        "Return `(distance, item)` for all items within `max_distance` of `item`"
+        if self.root is None:
+            return []
+
+        results, stack = [], [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming_distance(item, node[0])
+            if d <= max_distance:
+                results.append((d, node[0]))
+            # By the triangle inequality, matches can only be under children in this range
+            for child_d, child in node[1].items():
+                if d - max_distance <= child_d <= d + max_distance:
+                    stack.append(child)
+        return results
+
+
+def find_near_duplicate_images(
+    files: List[PathLike],
+    method: Literal["ahash", "dhash", "phash"] = "phash",
+    hash_size: int = 8,
+    max_distance: int = 4,
+    workers: Optional[int] = None,
+    verbose: bool = True,
+) -> Tuple[List[List[PathLike]], Dict[PathLike, int]]:
+    """
+    Cluster `files` whose perceptual hashes are within `max_distance` bits of each
+    other (transitively), using a `BKTree` rather than comparing every pair.
+    Returns the clusters with more than one file, and the hash of every file
+    """
+    hashes = compute_image_hashes(files, method, hash_size, workers, verbose)
+    hash2files = defaultdict(list)
+    for f, h in zip(files, hashes):
+        if h is not None:
+            hash2files[h].append(f)
+
+    # Union-find over the unique hashes
+    parent = {h: h for h in hash2files}
+
+    def find(h):
+        while parent[h] != h:
+            parent[h] = parent[parent[h]]
+            h = parent[h]
+        return h
+
+    tree = BKTree(hash2files)
+    for h in tqdm(hash2files, desc="Finding near duplicates", disable=not verbose):
+        for _, other in tree.search(h, max_distance):
+            root_a, root_b = find(h), find(other)
+            if root_a != root_b:
+                parent[root_a] = root_b
+
+    clusters = defaultdict(list)
+    for h, fs in hash2files.items():
+        clusters[find(h)].extend(fs)
+
+    clusters = [c for c in clusters.values() if len(c) > 1]
+    file2hash = {f: h for f, h in zip(files, hashes) if h is not None}
+    return sorted(clusters, key=len, reverse=True), file2hash
+
+
+def near_duplicates_to_df(clusters: List[List[PathLike]], file2hash: Dict[PathLike, int]) -> pd.DataFrame:
+    "One row per file: `cluster`, `file`, `hash` (hex)"
+    rows = [
+        {"cluster": i, "file": str(f), "hash": f"{file2hash[f]:x}"}
+        for i, cluster in enumerate(clusters)
+        for f in cluster
+    ]
+    return pd.DataFrame(rows, columns=["cluster", "file", "hash"])
@@ -20,17 +20,22 @@ class ImageInferenceDataset(Dataset, ABC):
         fnames: List[os.PathLike] = None,
         img_folders: Optional[List[os.PathLike]] = None,
         sort_fnames: bool = True,
+        compact_fnames: bool = False,
     ):
-        self.fnames = collate_image_filenames(fnames, img_folders)
-        if sort_fnames:
-            self.fnames.sort()
-
-        num_unique_files = len(set(self.fnames))
+        """
+        Use `compact_fnames` to store `self.fnames` as a `FileManifest` rather than
+        a list, which uses far less memory and isn't copied into DataLoader workers
+        """
+        self.fnames = collate_image_filenames(
+            fnames, img_folders, sort=sort_fnames, return_manifest=compact_fnames
+        )
+
+        num_unique_files = self.fnames.num_unique() if compact_fnames else len(set(self.fnames))
         if not num_unique_files == len(self.fnames):
             before = len(self.fnames)
             logger.warning(f"Found {before} - {num_unique_files} duplicate filenames")
 
-            self.fnames = sorted(set(self.fnames))
+            self.fnames = self.fnames.dedupe() if compact_fnames else sorted(set(self.fnames))
             after = len(self.fnames)
 
             logger.info(f"Removed duplicate filenames. Total no. filenames: {before} -> {after}")
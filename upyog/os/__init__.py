@@ -1,4 +1,13 @@
 from .utils import *
 from .read_files import *
 from .patch_pathlib import *
+from .file_index import *
+from .manifest import *
+from .file_types import *
+from .shard_manifests import *
+from .transfer import *
+from .disk_usage import *
+from .tar_samples import *
+from .tar_index import *
+from .tar_writer import *
 from .read_files import _IMAGE_EXTENSIONS, _VIDEO_EXTENSIONS
@@ -1,5 +1,15 @@
 from upyog.imports import *
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
 from upyog.os.read_files import *
+from upyog.os.read_files import _IMAGE_EXTENSIONS
+from upyog.os.disk_usage import FileCounts, count_files_in_subfolders
+from upyog.os.file_index import FileListingCache, DEFAULT_FILE_LISTING_CACHE
+from upyog.os.shard_manifests import write_shard_manifests
+from upyog.os.tar_index import _is_index_current, build_tar_index
+from upyog.os.tar_writer import write_tar_shards
+from upyog.os.transfer import transfer_files
+from upyog.os.utils import check_corrupted_images, write_text
 from upyog.utils import *
 from upyog.cli import *
 
@@ -15,6 +25,8 @@ def remove_duplicates_from_folder(
         str,
         nargs="+",
     ) = None,
+    by: P("Match files by their 'name' (stem) or their 'content'", str, choices=["name", "content"]) = "name",
+    workers: P("No. of threads used to hash files with `--by content`", int) = 8,
 ):
     """
             --------- DUPLICATE REMOVER ---------
@@ -23,6 +35,10 @@ def remove_duplicates_from_folder(
     recursively, and removes all the files from the `input` folder that exist in
     `target` folders
 
+    With `--by content`, files are matched by their contents instead, so only
+    true duplicates are removed, regardless of their names. Files are compared
+    by size, then by a hash of their first 64KB, and only then by a full hash
+
     If input folder has the following files:
     ├── input-folder
     │   ├── file1.jpg
@@ -46,21 +62,21 @@ def remove_duplicates_from_folder(
     remove-duplicates-from-folder
         --i input-folder
         --t target-folder-1   target-folder-2   ...
+        --by content
     """
     cleanup_path = Path(i)
     target_paths = [Path(p) for p in t]
 
-    target_fnames = flatten([get_files(path, recurse=True) for path in target_paths])
-    target_fnames = [f.stem for f in target_fnames]
-
-    cleanup_files = get_files(cleanup_path, recurse=True)
-    cleanup_fnames = [f.stem for f in cleanup_files]
+    if by == "content":
+        return _remove_duplicates_by_content(cleanup_path, target_paths, workers)
 
-    fnames_to_delete = set.intersection(set(cleanup_fnames), set(target_fnames))
+    target_fnames = set(
+        f.stem for path in target_paths for f in iter_files(path, recurse=True)
+    )
 
     counter = 0
-    for f in track(cleanup_files, "Scanning Files..."):
-        if f.stem in fnames_to_delete:
+    for f in tqdm(iter_files(cleanup_path, recurse=True), "Scanning Files..."):
+        if f.stem in target_fnames:
             print(f"Deleting {f.name}")
             counter += 1
             f.unlink()
@@ -68,13 +84,40 @@ def remove_duplicates_from_folder(
     print(f"Deleted {counter} files")
 
 
+def _remove_duplicates_by_content(cleanup_path: Path, target_paths: List[Path], workers: int):
+    target_files = {
+        os.path.abspath(f) for path in target_paths
+        for f in iter_files(path, recurse=True, return_type="str")
+    }
+    # Files that are inside both the input and target folders are only listed once
+    cleanup_files = {
+        os.path.abspath(f) for f in iter_files(cleanup_path, recurse=True, return_type="str")
+    } - target_files
+
+    def group_filter(group: List[str]) -> bool:
+        # Only files that collide with both a target and an input file can cause a deletion
+        return any(f in target_files for f in group) and any(f in cleanup_files for f in group)
+
+    counter = 0
+    for group in find_duplicate_files(
+        sorted(cleanup_files | target_files), workers=workers, group_filter=group_filter
+    ):
+        for f in group:
+            if f in cleanup_files:
+                print(f"Deleting {f}")
+                counter += 1
+                os.remove(f)
+
+    print(f"Deleted {counter} files")
+
+
 @call_parse
 def add_parent_folder_name(
     # i: P("Input folder(s) and files", str, nargs="+"),
     i: P("Input folder", str),
     sep: P("Separator", str) = "_",
 ):
-    files = get_files(i, recurse=True)
+    files = iter_files(i, recurse=True)
     for file in tqdm(files):
         if file.is_file():
             new_name = file.with_name(f"{file.parent.name}{sep}{file.name}")
@@ -86,6 +129,8 @@ def add_parent_folder_name(
 def find_common_files_between_folders(
     i: P("Input folders", str, nargs="+"),
     include_parent: P("Include name of parent folder?", bool) = False,
+    o: P("(Optional) Save the full overlap matrix to this .csv / .parquet file", str) = None,
+    workers: P("No. of folders to list concurrently", int) = 8,
 ):
     """
             --------- COMMON FILES DETECTOR ---------
@@ -95,13 +140,13 @@ def find_common_files_between_folders(
 
     Say we have the following input folders:
     ├── input-folder-1
-    │   ├── file1.jpg
-    │   ├── file2.jpg
-    │   └── file3.jpg
+    │   ├── file1.jpg
+    │   ├── file2.jpg
+    │   └── file3.jpg
     ├
     ├── input-folder-2
-    │   ├── file3.jpg
-    │   ├── file4.jpg
+    │   ├── file3.jpg
+    │   ├── file4.jpg
 
     Where there's one common file between input-folder-1 and 2, the result
     is as follows:
@@ -116,6 +161,8 @@ def find_common_files_between_folders(
         }
 
     Note that the number of files in each folder is added in brackets.
+    Use `--o` to also save the full matrix of overlaps (the diagonal being
+    the no. of unique filenames in each folder).
 
     Usage:
     ------
@@ -126,38 +173,62 @@ def find_common_files_between_folders(
     assert i
     input_folders = i
 
-    def folder_with_parent(f, files=None):
+    def folder_with_parent(f, num_files=None):
         f = Path(f)
         result = f"{f.parent.name} / {f.name}" if include_parent else f.name
-        return f"{result} ({len(files)})" if files is not None else result
+        return f"{result} ({num_files})" if num_files is not None else result
 
-    folder2files = {folder: get_image_files(folder) for folder in input_folders}
-    folder2files = {
-        folder: [f.name for f in files] for folder, files in folder2files.items()
-    }
-    folder2files = {folder_with_parent(k, v): v for k, v in folder2files.items()}
+    def list_names(folder) -> List[str]:
+        return [e.name for e in get_image_files(folder, return_type="entry")]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        folder_files = list(executor.map(list_names, input_folders))
 
-    # folder_names = [folder_with_parent(f) for f in folder2files.keys()]
-    # results = dict.fromkeys(folder_names)
-    results = dict.fromkeys(folder2files)
-    for f1 in folder2files.keys():
-        f1_common = {}
-        for f2, files in folder2files.items():
-            if f2 == f1:
-                continue
+    labels = [folder_with_parent(f, len(files)) for f, files in zip(input_folders, folder_files)]
+    overlap = _filename_overlap_matrix(folder_files)
 
-            common = set(folder2files[f1]).intersection(files)
-            f1_common[f2] = len(common)
+    results = dict.fromkeys(labels)
+    for a, f1 in enumerate(labels):
+        results[f1] = {f2: int(overlap[a, b]) for b, f2 in enumerate(labels) if f2 != f1}
 
-        results[f1] = f1_common
+    if o:
+        df = pd.DataFrame(overlap, index=labels, columns=labels)
+        if Path(o).suffix == ".parquet": df.to_parquet(o)
+        else:                            df.to_csv(o)
+        logger.info(f"Saved overlap matrix to {o}")
 
     rich.print_json(data=results)
     return results
 
 
+def _filename_overlap_matrix(folder_files: List[List[str]]) -> np.ndarray:
+    """
+    Return a (folders x folders) matrix of the no. of unique filenames each pair of
+    folders has in common, from a single filename -> folders inverted index.
+    Filenames found in the exact same set of folders are counted together, so the
+    matrix is updated once per distinct set of folders rather than once per file
+    """
+    name2folders = defaultdict(set)
+    for idx, files in enumerate(folder_files):
+        for name in files:
+            name2folders[name].add(idx)
+
+    folder_sets = defaultdict(int)
+    for folders in name2folders.values():
+        folder_sets[tuple(sorted(folders))] += 1
+
+    overlap = np.zeros((len(folder_files), len(folder_files)), dtype=np.int64)
+    for folders, count in folder_sets.items():
+        idxs = np.array(folders)
+        overlap[np.ix_(idxs, idxs)] += count
+    return overlap
+
+
 @call_parse
 def print_folder_distribution(
-    parent_folders: P("Parent folders", str, nargs="+")
+    parent_folders: P("Parent folders", str, nargs="+"),
+    size: P("Also add up the size of the files, in total and per extension", store_true) = False,
+    workers: P("No. of subfolders to count concurrently", int) = 16,
 ) -> Dict[str, pd.DataFrame]:
     """
     Prints the number of files inside each given `parent_folders`.
@@ -165,17 +236,25 @@ def print_folder_distribution(
     results = {}
 
     for folder in parent_folders:
-        freq = {}
         folder = Path(folder)
-        for subdir in sorted(folder.list_dirs()):
-            freq[subdir.name] = len(get_files(subdir, recurse=True))
+        counts = count_files_in_subfolders(folder, with_bytes=size, workers=workers)
 
-        freq = pd.DataFrame([freq]).T.reset_index()
-        freq.columns = ["Sub Folders", "Frequency"]
+        freq = pd.DataFrame({"Sub Folders": list(counts), "Frequency": [c.files for c in counts.values()]})
+        if size:
+            freq["Size (MB)"] = [round(c.bytes / 1024**2, 2) for c in counts.values()]
         rich.print()
         rich.print(f"---------- {folder.name.upper()} ----------")
         freq = print_df(freq)
 
+        if size:
+            total = FileCounts()
+            for c in counts.values():
+                total.update(c)
+            print_df(pd.DataFrame(
+                [(ext or "(none)", n, round(b / 1024**2, 2)) for ext, (n, b) in sorted(total.extensions.items())],
+                columns=["Extension", "Files", "Size (MB)"],
+            ))
+
         results[folder.name] = freq
 
     return results
@@ -187,31 +266,204 @@ def move_files(
     o: P(help="Path to the output directory", type=str) = None,
     move: P(help="Move files (destructively)", type=store_true) = False,
     max_N: P("Max no. of files from `i` to move. If provided, a random sample is taken", int) = None,
+    mode: P("How to transfer files. `--move` is the same as `--mode move`", str, choices=["copy", "move", "hardlink", "reflink"]) = "copy",
+    workers: P("No. of files to transfer concurrently", int) = 8,
+    journal: P("(Optional) .jsonl file to record transfers in, to resume an interrupted run", str) = None,
 ):
     inputs = i
-    out_path = Path(o)
-    out_path.mkdir(exist_ok=True)
-
-    files = flatten([get_files(p, recurse=True) for p in inputs])
+    for p in inputs:
+        if not Path(p).exists(): raise NotADirectoryError(f"Invalid path: {p}")
 
     if max_N:
+        files = flatten([get_files(p, recurse=True, return_type="str") for p in inputs])
         random.shuffle(files)
         files = files[:max_N]
+    else:
+        files = (f for p in inputs for f in iter_files(p, recurse=True, return_type="str"))
 
-    for p in inputs:
-        if not Path(p).exists(): raise NotADirectoryError(f"Invalid path: {p}")
+    stats = transfer_files(files, o, mode="move" if move else mode, workers=workers, journal=journal)
+    logger.info(f"{o}: {stats}")
+
+
+@call_parse
+def build_file_index(
+    i: P("Root folders to index", str, nargs="+") = None,
+    cache: P("Path to the SQLite index file", str) = str(DEFAULT_FILE_LISTING_CACHE),
+    workers: P("No. of threads used to list directories", int) = 8,
+    followlinks: P("Follow symlinked folders", store_true) = False,
+):
+    """
+            --------- FILE INDEX BUILDER ---------
+
+    Builds (or refreshes) the on-disk file listing index used by
+    `get_files(..., cache=...)`. Only directories that changed since
+    the last run are listed again, and entries for directories that
+    no longer exist are dropped.
+
+    Usage:
+    ------
+
+    build-file-index  --i dataset-root-1 dataset-root-2  --workers 16
+    """
+    assert i
+    with FileListingCache(cache) as file_cache:
+        for root in i:
+            start = time.time()
+            hits, misses = file_cache.hits, file_cache.misses
+            num_files = file_cache.refresh(root, followlinks=followlinks, workers=workers)
+            logger.info(
+                f"{root}: {num_files} files in {time.time() - start:.2f}s "
+                f"({file_cache.misses - misses} dirs re-listed, {file_cache.hits - hits} unchanged)"
+            )
+
+
+@call_parse
+def shard_file_manifests(
+    i: P("Root folders to walk", str, nargs="+") = None,
+    o: P("Output folder for the shard manifests", str) = None,
+    n: P("No. of shards", int) = None,
+    balance: P("Balance shards by file 'count' or total 'size'", str, choices=["count", "size"]) = "count",
+    ext: P("(Optional) Only include files with these extensions e.g. .jpg .png", str, nargs="+") = None,
+    images: P("Only include image files", store_true) = False,
+    workers: P("No. of threads used to list directories", int) = 8,
+):
+    """
+            --------- SHARD MANIFEST WRITER ---------
+
+    Walks the input folders once and writes `n` balanced file manifests
+    (Parquet, see `upyog.os.FileManifest`) to the output folder, so that
+    each inference process / node only reads its own shard:
+
+        from upyog.os import load_shard_manifest
+        files = load_shard_manifest(output_folder, rank, world_size)
 
-    before_moving = get_files(out_path)
-    for f in tqdm(files):
-        if move:
-            shutil.move(f, out_path / f.name)
-        else:
-            try:
-                shutil.copy(f, out_path / f.name)
-            # If file already exists, no-op
-            except shutil.SameFileError:
-                pass
-    after_moving = get_files(out_path)
-    new_files = set(after_moving) - set(before_moving)
-
-    logger.info(f"moved {len(files)}/{len(new_files)} files to output folder")
+    Files are assigned to shards by hashing their path relative to the
+    input folder, so a file always lands in the same shard between runs.
+
+    Usage:
+    ------
+
+    shard-file-manifests  --i dataset-root  --o shards/  --n 64  --images  --balance size
+    """
+    assert i and o and n
+    extensions = _IMAGE_EXTENSIONS if images else ext
+    output_files = write_shard_manifests(
+        i, o, num_shards=n, balance=balance, extensions=extensions, workers=workers
+    )
+    logger.info(f"Wrote {len(output_files)} shard manifests to {o}")
+
+
+@call_parse
+def scan_corrupted_images(
+    i: P("Input folders", str, nargs="+") = None,
+    full: P("Fully decode each image (slow) instead of only parsing the header", store_true) = False,
+    workers: P("No. of processes", int) = os.cpu_count(),
+    journal: P("(Optional) .jsonl file to record results in, to resume interrupted scans", str) = None,
+    o: P("(Optional) Text file to write the paths of corrupted images to", str) = None,
+):
+    """
+            --------- CORRUPTED IMAGE SCANNER ---------
+
+    Scans all images in the input folders and reports those that can't
+    be read. Use `--full` to catch truncated / partially corrupted files
+    as well, which only fail once the pixel data is decoded.
+
+    With `--journal`, every result is recorded as it comes in; re-running
+    with the same journal skips the files that were already checked.
+
+    Usage:
+    ------
+
+    scan-corrupted-images  --i folder-1 folder-2  --full  --journal scan.jsonl  --o corrupted.txt
+    """
+    assert i
+    files = get_image_files(i, workers=workers, return_type="str")
+    corrupted = check_corrupted_images(files, full_decode=full, workers=workers, journal=journal)
+
+    if o:
+        write_text("\n".join(corrupted), o)
+        logger.info(f"Wrote the paths of {len(corrupted)} corrupted images to {o}")
+
+    return corrupted
+
+
+@call_parse
+def index_tar_files(
+    i: P("Folders with .tar files, or .tar files", str, nargs="+") = None,
+    workers: P("No. of .tar files to index concurrently", int) = 8,
+    force: P("Rebuild indexes that are already up to date", store_true) = False,
+):
+    """
+            --------- TAR INDEXER ---------
+
+    Writes a `<name>.tar.index.parquet` file next to every (uncompressed)
+    .tar file with the offset and size of each member, reading only the
+    tar headers. Members can then be read directly with `TarMemberReader`
+    without extracting or scanning the archive.
+    Indexes that are already up to date are skipped.
+
+    Usage:
+    ------
+
+    index-tar-files  --i shards-folder-1 shards-folder-2  --workers 16
+    """
+    assert i
+    tar_files = []
+    for p in i:
+        tar_files += [Path(p)] if Path(p).is_file() else get_files(p, extensions=[".tar"], recurse=True)
+    todo = tar_files if force else [f for f in tar_files if not _is_index_current(f)]
+    logger.info(f"Indexing {len(todo)} of {len(tar_files)} .tar files ({len(tar_files) - len(todo)} up to date)")
+
+    def index(tar_file):
+        try:
+            build_tar_index(tar_file)
+            return None
+        except (tarfile.TarError, OSError) as e:
+            return f"{type(e).__name__}: {e}"
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        errors = list(tqdm(executor.map(index, todo), total=len(todo), desc="Indexing .tar files"))
+
+    for tar_file, error in zip(todo, errors):
+        if error is not None:
+            logger.warning(f"Failed to index {tar_file}: {error}")
+
+
+@call_parse
+def pack_files_into_tar_shards(
+    i: P("Input folders", str, nargs="+") = None,
+    o: P("Output folder for the .tar shards", str) = None,
+    shard_size_mb: P("Target size of each shard, in MB", int) = 1024,
+    prefix: P("Shards are named `{prefix}-000000.tar`, ...", str) = "shard",
+    ext: P("(Optional) Only include files with these extensions e.g. .jpg .json", str, nargs="+") = None,
+    workers: P("No. of shards to write concurrently", int) = 8,
+    no_index: P("Don't write a `.index.parquet` member index next to each shard", store_true) = False,
+    overwrite: P("Overwrite shards that already exist", store_true) = False,
+):
+    """
+            --------- TAR SHARD WRITER ---------
+
+    Packs the files in the input folders into ~`shard_size_mb` sized .tar
+    shards (the reverse of `extract-and-organise-tar-archive`). Files with
+    the same name up to the first '.' (e.g. 0001.jpg, 0001.json, 0001.url.txt)
+    form a sample, and are always written to the same shard, next to each other,
+    so the shards can be read with `TarSampleReader`.
+    A member index for `TarMemberReader` is written next to each shard.
+
+    Usage:
+    ------
+
+    pack-files-into-tar-shards  --i downloaded-images  --o shards  --shard_size_mb 1024  --workers 16
+    """
+    assert i and o
+    shards = write_tar_shards(
+        i, o, shard_size=shard_size_mb * 1024**2, prefix=prefix, extensions=ext,
+        workers=workers, index=not no_index, overwrite=overwrite,
+    )
+    num_skipped = sum(s.skipped for s in shards)
+    num_samples = sum(s.num_samples for s in shards)
+    num_bytes = sum(s.num_bytes for s in shards)
+    logger.info(
+        f"{len(shards)} shards ({num_skipped} already existed) with {num_samples} samples, "
+        f"{num_bytes / 1024**3:.2f} GB in {o}"
+    )
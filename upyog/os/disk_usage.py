@@ -0,0 +1,168 @@
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Collection, Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
+from upyog.os.read_files import PathLike, _normalise_extensions, _scandir, _walk
+
+
+__all__ = ["FileCounts", "DiskUsage", "count_files", "count_files_in_subfolders", "iter_disk_usage", "disk_usage"]
+
+
+@dataclass
+class FileCounts:
+    files: int = 0
+    bytes: int = 0
+    # Lowercase extension ("" if none) -> [no. of files, no. of bytes]
+    extensions: Dict[str, List[int]] = field(default_factory=dict)
+
+    def update(self, other: "FileCounts") -> "FileCounts":
+        self.files += other.files
+        self.bytes += other.bytes
+        for ext, (n, b) in other.extensions.items():
+            counts = self.extensions.setdefault(ext, [0, 0])
+            counts[0] += n
+            counts[1] += b
+        return self
+
+
+def _entry_stat(entry: os.DirEntry) -> Optional[os.stat_result]:
+    try:
+        return entry.stat()
+    except OSError:  # e.g. a broken symlink
+        return None
+
+
+def _scandir_with_stats(path: str):
+    "`_scandir`, but also `stat` every file, so it's done in the walker's threads (`DirEntry` caches it)"
+    dirs, files, links = _scandir(path)
+    for e in files:
+        _entry_stat(e)
+    return dirs, files, links
+
+
+def _count_entries(
+    entries: List[os.DirEntry],
+    extensions: Optional[FrozenSet[str]],
+    with_bytes: bool,
+    seen_inodes: Optional[Set[Tuple[int, int]]] = None,
+) -> FileCounts:
+    "Count the `entries` that `get_files` would return. Hardlinks already in `seen_inodes` add no bytes"
+    counts = FileCounts()
+    ext_counts = counts.extensions
+    for e in entries:
+        name = e.name
+        if name.startswith("."):
+            continue
+        ext = "." + name.rpartition(".")[2].lower()
+        if extensions is not None and ext not in extensions:
+            continue
+        if "." not in name:
+            ext = ""
+        counts.files += 1
+        if with_bytes:
+            st = _entry_stat(e)
+            size = st.st_size if st is not None else 0
+            if seen_inodes is not None and st is not None and st.st_nlink > 1:
+                inode = (st.st_dev, st.st_ino)
+                if inode in seen_inodes:
+                    size = 0
+                seen_inodes.add(inode)
+            counts.bytes += size
+            c = ext_counts.get(ext)
+            if c is None:
+                c = ext_counts[ext] = [0, 0]
+            c[0] += 1
+            c[1] += size
+    return counts
+
+
+def count_files(
+    path: PathLike,
+    extensions: Optional[Collection[str]] = None,
+    recurse: bool = True,
+    with_bytes: bool = False,
+    workers: Optional[int] = None,
+    followlinks: bool = False,
+) -> FileCounts:
+    """
+    Count the files in `path` that `get_files` would return, without creating a
+    path per file. With `with_bytes`, the size of every file (and per extension)
+    is also added up, from the `stat` that `os.DirEntry`s cache.
+    `workers` lists the directories of `path` with a thread pool
+    """
+    extensions = _normalise_extensions(extensions)
+    counts = FileCounts()
+    if recurse:
+        scandir = _scandir_with_stats if with_bytes else _scandir
+        for _, entries in _walk(path, followlinks=followlinks, workers=workers, scandir=scandir):
+            counts.update(_count_entries(entries, extensions, with_bytes))
+    else:
+        with os.scandir(path) as it:
+            counts.update(_count_entries([e for e in it if e.is_file()], extensions, with_bytes))
+    return counts
+
+
+def count_files_in_subfolders(
+    folder: PathLike,
+    extensions: Optional[Collection[str]] = None,
+    with_bytes: bool = False,
+    workers: int = 16,
+) -> Dict[str, FileCounts]:
+    """
+    `count_files` for each subfolder of `folder` (e.g. one per class of a dataset),
+    counting `workers` subfolders concurrently. Returns `{subfolder name: FileCounts}`
+    sorted by name
+    """
+    with os.scandir(folder) as it:
+        subdirs = sorted(e.name for e in it if e.is_dir())
+
+    def count(name):
+        return count_files(os.path.join(folder, name), extensions, with_bytes=with_bytes)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(subdirs, executor.map(count, subdirs)))
+
+
+@dataclass
+class DiskUsage(FileCounts):
+    # Totals per direct subfolder of the root; files directly in the root are under "."
+    subdirs: Dict[str, FileCounts] = field(default_factory=dict)
+
+
+def iter_disk_usage(
+    path: PathLike,
+    extensions: Optional[Collection[str]] = None,
+    workers: Optional[int] = 8,
+    dedupe_hardlinks: bool = True,
+    followlinks: bool = False,
+) -> Iterator[Tuple[str, FileCounts]]:
+    """
+    Walk `path` with `workers` threads (which also `stat` the files) and yield
+    `(dirpath, FileCounts)` for the files directly in each directory as soon as
+    it has been read, so results for very large trees can be reported / saved
+    incrementally. With `dedupe_hardlinks`, files hardlinked to one already seen
+    add no bytes, like `du`. Only the files `get_files` would return are counted
+    """
+    extensions = _normalise_extensions(extensions)
+    seen_inodes = set() if dedupe_hardlinks else None
+    for dirpath, entries in _walk(path, followlinks=followlinks, workers=workers, scandir=_scandir_with_stats):
+        yield dirpath, _count_entries(entries, extensions, True, seen_inodes)
+
+
+def disk_usage(
+    path: PathLike,
+    extensions: Optional[Collection[str]] = None,
+    workers: Optional[int] = 8,
+    dedupe_hardlinks: bool = True,
+    followlinks: bool = False,
+) -> DiskUsage:
+    "Total no. of files and bytes in `path`, per extension and per direct subfolder, see `iter_disk_usage`"
+    root = os.fspath(path)
+    prefix_len = len(os.path.join(root, ""))
+    usage = DiskUsage()
+    for dirpath, counts in iter_disk_usage(root, extensions, workers, dedupe_hardlinks, followlinks):
+        usage.update(counts)
+        subdir = dirpath[prefix_len:].split(os.sep, 1)[0] if dirpath != root else "."
+        usage.subdirs.setdefault(subdir, FileCounts()).update(counts)
+    return usage
@@ -1,13 +1,20 @@
+import json
+import os
 import shutil
 import tarfile
-import tempfile
 
-from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from typing_extensions import Literal
 from tqdm import tqdm
 from rich import print, print_json
 from upyog.cli import call_parse, P
-from upyog.os import get_files, load_json
+from upyog.os import PathLike, get_files, load_json, read_jsonl
+from upyog.os.tar_samples import _suffix_to_field
+from upyog.os.transfer import _partial_path
 
 
 @call_parse
@@ -16,6 +23,8 @@ def extract_and_organize_tarfiles(
     output_dir: P("(Optional) Path to the output dir. If not provided, outputs are saved in `root_dir`") = None,
     extract_structure: P("(Optional) Path to a JSON file that captures the output structure. If not provided, we attempt to detect it automatically") = None,
     force_overwrite: P("(Optional) Force overwrite of existing files") = False,
+    workers: P("No. of .tar files to extract concurrently, each in its own process", int) = 1,
+    detect_samples: P("No. of .tar files (evenly spread) whose member names are used to detect the structure", int) = 1,
 ):
     """
     ----- extract-and-organise-tar-archive -----
@@ -32,6 +41,11 @@ def extract_and_organize_tarfiles(
 
     If not provided, it is automatically detected.
     Then, we extract all the files, and create subfolders for each type in the structure.
+    Use `--workers N` to extract N .tar files at a time.
+
+    Every fully extracted .tar file is recorded (path, size, mtime, no. of members) in
+    `.extracted_shards.jsonl` in the `output_dir`, and skipped by later runs unless it
+    has changed. Other .tar files are checked member by member before extracting them.
     """
     root_dir = Path(root_dir)
     output_dir = Path(output_dir) if output_dir else root_dir
@@ -46,13 +60,9 @@ def extract_and_organize_tarfiles(
     total_files = len(tar_files)
     print(f"Found {total_files} .tar files to process.")
 
-    # Detect structure using the first .tar file
+    # Detect structure from the member names of (a sample of) the .tar files
     if extract_structure is None:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            with tarfile.open(tar_files[0], "r") as tar:
-                tar.extractall(temp_dir)
-            temp_path = Path(temp_dir)
-            extract_structure = detect_structure(temp_path)
+        extract_structure = detect_structure_from_tarfiles(tar_files, num_samples=detect_samples)
 
         print("Detected structure:")
         print_json(data=extract_structure)
@@ -61,73 +71,220 @@ def extract_and_organize_tarfiles(
     for subdir in extract_structure.values():
         output_dir.joinpath(subdir).mkdir(parents=True, exist_ok=True)
 
-    # Function to check if a tar file has already been extracted
-    def is_tar_extracted(tar_file, output_dir, extract_structure):
-        with tarfile.open(tar_file, "r") as tar:
-            for member in tar.getmembers():
-                suffix = "".join(Path(member.name).suffixes)
-                if suffix in extract_structure:
-                    subdir = extract_structure[suffix]
-                    output_file = output_dir.joinpath(subdir, Path(member.name).name)
-                    if not output_file.exists():
-                        return False
-        return True
-
-    # Loop through all .tar files
-    progress_bar = tqdm(tar_files, "Extracting .tar files", unit="file")
-    for tar_file in progress_bar:
-        progress_bar.set_description(f"Processing {tar_file.name}")
-
-        # Check if the tar file has already been extracted
-        if is_tar_extracted(tar_file, output_dir, extract_structure) and not force_overwrite:
-            progress_bar.write(f"Skipping {tar_file.name} (already extracted)")
-            continue
-
-        try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                with tarfile.open(tar_file, "r") as tar:
-                    tar.extractall(temp_dir)
-                temp_path = Path(temp_dir)
-
-                for file_path in temp_path.iterdir():
-                    if file_path.is_file():
-                        suffix = "".join(file_path.suffixes)
-
-                        if suffix in extract_structure:
-                            subdir = extract_structure[suffix]
-                            dest_path = output_dir.joinpath(subdir, file_path.name)
-                            
-                            if dest_path.exists() and not force_overwrite:
-                                progress_bar.write(f"Skipping {file_path.name} (already exists)")
-                            else:
-                                shutil.move(str(file_path), str(dest_path))
-                        else:
-                            progress_bar.write(f"Warning: Unexpected suffix '{suffix}' found in file '{file_path.name}'")
-        except tarfile.ReadError:
-            progress_bar.write(f"Failed to extract {tar_file.name}")
+    # Shards recorded in the manifest, and unchanged since, are skipped without opening them
+    manifest_path = output_dir / EXTRACTION_MANIFEST
+    done = load_extraction_manifest(manifest_path) if not force_overwrite else {}
+    todo = [f for f in tar_files if not _is_in_manifest(f, done)]
+    if len(todo) < len(tar_files):
+        print(f"Skipping {len(tar_files) - len(todo)} .tar files already recorded in {manifest_path}")
+
+    extract_shard = partial(
+        _extract_shard, output_dir=output_dir, extract_structure=extract_structure, force_overwrite=force_overwrite
+    )
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        futures = [executor.submit(extract_shard, f) for f in todo]
+        results = as_completed(futures)
+        results = (future.result() for future in results)
+    else:
+        executor = None
+        results = map(extract_shard, todo)
+
+    failed = []
+    num_extracted, num_bytes = 0, 0
+    progress_bar = tqdm(results, "Extracting .tar files", total=len(todo), unit="file")
+    manifest = open(manifest_path, "a")
+    try:
+        for result in progress_bar:
+            for message in result.messages:
+                progress_bar.write(message)
+            if result.status == "skipped":
+                progress_bar.write(f"Skipping {result.name} (already extracted)")
+            elif result.status == "failed":
+                progress_bar.write(f"Failed to extract {result.name}: {result.error}")
+                failed.append(result)
+            if result.status != "failed":
+                manifest.write(json.dumps(result.manifest_record()) + "\n")
+                manifest.flush()
+
+            num_extracted += result.extracted
+            num_bytes += result.bytes
+            progress_bar.set_postfix(files=num_extracted, GB=f"{num_bytes / 1024**3:.2f}", failed=len(failed))
+    finally:
+        manifest.close()
+        if executor is not None:
+            # Don't start the remaining shards if interrupted (`shutdown(cancel_futures=True)` is 3.9+)
+            for future in futures:
+                future.cancel()
+            executor.shutdown()
 
     print("\n\n  Extraction and organization complete.")
     print("-----------------------------------------")
     print(f"Total .tar files processed: {len(tar_files)}")
+    if failed:
+        print(f"Failed to extract {len(failed)} .tar files:")
+        for result in failed:
+            print(f"  {result.tar_file}: {result.error}")
     for subdir in extract_structure.values():
         print(f"Total {subdir} files: {len(list(output_dir.joinpath(subdir).glob('*')))}")
 
 
+@dataclass
+class ShardResult:
+    tar_file: str
+    status: Literal["extracted", "skipped", "failed"] = "extracted"
+    extracted: int = 0  # No. of files written
+    bytes: int = 0
+    members: int = 0  # No. of files in the .tar file
+    size: int = 0  # Of the .tar file, and its `mtime_ns` when it was opened
+    mtime_ns: int = 0
+    error: Optional[str] = None
+    messages: List[str] = field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        return Path(self.tar_file).name
+
+    def manifest_record(self) -> dict:
+        return {"path": self.tar_file, "size": self.size, "mtime_ns": self.mtime_ns, "members": self.members}
+
+
+# Written to `output_dir`, with one line per fully extracted .tar file
+EXTRACTION_MANIFEST = ".extracted_shards.jsonl"
+
+
+def load_extraction_manifest(path: PathLike) -> Dict[str, dict]:
+    "Records of the .tar files extracted in previous runs, by absolute path"
+    return {record["path"]: record for record in read_jsonl(path)}
+
+
+def _is_in_manifest(tar_file: Path, done: Dict[str, dict]) -> bool:
+    "`tar_file` was extracted, and hasn't changed since (same size and mtime)"
+    record = done.get(os.path.abspath(tar_file))
+    if record is None:
+        return False
+    st = os.stat(tar_file)
+    return record["size"] == st.st_size and record["mtime_ns"] == st.st_mtime_ns
+
+
+def _check_extracted(tar_file: PathLike, output_dir: Path, extract_structure: dict) -> Tuple[bool, int]:
+    "(Whether every member of `tar_file` in `extract_structure` exists in `output_dir`, no. of file members)"
+    num_members = 0
+    with tarfile.open(tar_file, "r") as tar:
+        for member in tar.getmembers():
+            if not member.isfile():
+                continue
+            num_members += 1
+            suffix = "".join(Path(member.name).suffixes)
+            if suffix in extract_structure:
+                subdir = extract_structure[suffix]
+                output_file = output_dir.joinpath(subdir, Path(member.name).name)
+                if not output_file.exists():
+                    return False, num_members
+    return True, num_members
+
+
+def is_tar_extracted(tar_file: PathLike, output_dir: Path, extract_structure: dict) -> bool:
+    "Check if every member of `tar_file` that's in `extract_structure` exists in `output_dir`"
+    return _check_extracted(tar_file, output_dir, extract_structure)[0]
+
+
+def extract_tarfile(
+    tar_file: PathLike,
+    output_dir: Path,
+    extract_structure: dict,
+    force_overwrite: bool = False,
+    buffer_size: int = 1024**2,
+) -> ShardResult:
+    """
+    Stream the members of `tar_file` straight into their `extract_structure` subfolder
+    of `output_dir` in a single sequential pass, copying at most `buffer_size` bytes
+    at a time. Each file is written to a `.partial` file first and renamed once
+    complete, so an interrupted extraction never leaves truncated files behind.
+    Members are saved by their file name; members in folders inside the archive are flattened
+    """
+    output_dir = Path(output_dir)
+    st = os.stat(tar_file)
+    result = ShardResult(os.path.abspath(tar_file), size=st.st_size, mtime_ns=st.st_mtime_ns)
+    with tarfile.open(tar_file, "r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            result.members += 1
+            name = Path(member.name).name
+            suffix = "".join(Path(name).suffixes)
+
+            if suffix not in extract_structure:
+                result.messages.append(f"Warning: Unexpected suffix '{suffix}' found in file '{name}'")
+                continue
+
+            dest_path = output_dir.joinpath(extract_structure[suffix], name)
+            if dest_path.exists() and not force_overwrite:
+                result.messages.append(f"Skipping {name} (already exists)")
+                continue
+
+            # Unique, so shards extracted concurrently with the same member name don't clash
+            partial_path = Path(_partial_path(os.fspath(dest_path)))
+            try:
+                with tar.extractfile(member) as src, open(partial_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, buffer_size)
+            except BaseException:
+                if partial_path.exists():  # `unlink(missing_ok=True)` is 3.8+
+                    partial_path.unlink()
+                raise
+            os.replace(partial_path, dest_path)
+            result.extracted += 1
+            result.bytes += member.size
+    return result
+
+
+def _extract_shard(tar_file: Path, output_dir: Path, extract_structure: dict, force_overwrite: bool) -> ShardResult:
+    "Process pool task: skip, extract or report why `tar_file` couldn't be extracted"
+    try:
+        if not force_overwrite:
+            # Not in the extraction manifest, but may have been extracted by an older / interrupted run
+            st = os.stat(tar_file)
+            is_extracted, num_members = _check_extracted(tar_file, output_dir, extract_structure)
+            if is_extracted:
+                return ShardResult(
+                    os.path.abspath(tar_file), status="skipped", members=num_members,
+                    size=st.st_size, mtime_ns=st.st_mtime_ns,
+                )
+        return extract_tarfile(tar_file, output_dir, extract_structure, force_overwrite)
+    except (tarfile.TarError, OSError) as e:
+        return ShardResult(os.path.abspath(tar_file), status="failed", error=f"{type(e).__name__}: {e}")
+
+
 def detect_structure(temp_path: Path) -> dict:
     files = get_files(temp_path)
-    unique_file_extensions = set(["".join(f.suffixes) for f in files])
-    unique_file_extensions = sorted(unique_file_extensions)
+    return _structure_from_suffixes("".join(f.suffixes) for f in files)
 
-    extract_structure = {}
-    for ext in unique_file_extensions:
-        assert ext.startswith(".")
 
-        orig_ext = deepcopy(ext)
+def detect_structure_from_tarfiles(tar_files: List[PathLike], num_samples: int = 1) -> dict:
+    """
+    Detect the structure from the names of the files in `num_samples` of `tar_files`,
+    spread evenly, to also catch suffixes that only some of the .tar files have.
+    Only the tar headers are read, the files' data is skipped over
+    """
+    num_samples = max(1, min(num_samples, len(tar_files)))
+    step = len(tar_files) / num_samples
+    samples = [tar_files[int(i * step)] for i in range(num_samples)]
+
+    suffixes = set()
+    for tar_file in samples:
+        with tarfile.open(tar_file, "r") as tar:
+            for member in tar:
+                name = Path(member.name).name
+                if member.isfile() and not name.startswith("."):
+                    suffixes.add("".join(Path(name).suffixes))
+    return _structure_from_suffixes(suffixes)
 
-        ext = ext[1:]
-        ext = ext.replace(".", "_")
-        ext = ext + "__data"
 
-        extract_structure[orig_ext] = ext
+def _structure_from_suffixes(suffixes: Iterable[str]) -> dict:
+    "Map each suffix to a subfolder name e.g. '.url.txt' -> 'url_txt__data'"
+    extract_structure = {}
+    for ext in sorted(set(suffixes)):
+        assert ext.startswith(".")
+        extract_structure[ext] = _suffix_to_field(ext)
 
     return extract_structure
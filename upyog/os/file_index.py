@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import threading
+import time
+
+from pathlib import Path
+from typing import List, Optional, Set, Tuple, Union
+from upyog.os.read_files import PathLike, _scandir, _walk
+
+
+__all__ = ["FileListingCache", "DEFAULT_FILE_LISTING_CACHE"]
+
+
+DEFAULT_FILE_LISTING_CACHE = Path.home() / ".cache" / "upyog" / "file_listing.sqlite"
+
+# Directories modified less than this long ago aren't trusted, as a change in
+# the same mtime "tick" (up to 2s on some filesystems) wouldn't be detected
+_MTIME_GRACE_NS = 2 * 10**9
+_SEP = "\0"
+
+
+class _CachedEntry:
+    "Minimal stand-in for `os.DirEntry` for files listed from the cache"
+    __slots__ = ("name", "path")
+
+    def __init__(self, dirpath: str, name: str):
+        self.name = name
+        self.path = os.path.join(dirpath, name)
+
+    def stat(self, follow_symlinks=True):
+        return os.stat(self.path, follow_symlinks=follow_symlinks)
+
+    def is_file(self, follow_symlinks=True):
+        if not follow_symlinks and self.is_symlink():
+            return False
+        return os.path.isfile(self.path)
+
+    def is_dir(self, follow_symlinks=True):
+        return False
+
+    def is_symlink(self):
+        return os.path.islink(self.path)
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return f"<_CachedEntry '{self.name}'>"
+
+
+class FileListingCache:
+    """
+    On-disk cache of directory listings, stored in a SQLite database.
+
+    Each directory is stored with its `mtime`. A directory's `mtime` changes
+    whenever an entry is added, removed or renamed inside it, so on a rescan
+    only directories whose `mtime` changed are listed again; the rest only
+    cost a single `stat`. Use with `get_files(..., cache=...)`
+    """
+
+    def __init__(self, path: PathLike = DEFAULT_FILE_LISTING_CACHE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS dirs "
+            "(path TEXT PRIMARY KEY, mtime_ns INTEGER, dirs TEXT, links TEXT, files TEXT)"
+        )
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def scandir(self, path: str) -> Tuple[List[str], List[_CachedEntry], Set[str]]:
+        "Drop-in replacement for `read_files._scandir` that reads from / updates the cache"
+        key = os.path.abspath(path)
+        mtime_ns = os.stat(path).st_mtime_ns
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT mtime_ns, dirs, links, files FROM dirs WHERE path = ?", (key,)
+            ).fetchone()
+            # Counted under the lock, as `scandir` runs in the walker's threads
+            is_hit = row is not None and row[0] == mtime_ns
+            if is_hit: self.hits += 1
+            else:      self.misses += 1
+
+        if is_hit:
+            _, dirs, links, files = row
+            return (
+                _split(dirs),
+                [_CachedEntry(path, f) for f in _split(files)],
+                set(_split(links)),
+            )
+
+        dirs, entries, links = _scandir(path)
+        if time.time_ns() - mtime_ns < _MTIME_GRACE_NS:
+            mtime_ns = -1
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?)",
+                (key, mtime_ns, _SEP.join(dirs), _SEP.join(links), _SEP.join(e.name for e in entries)),
+            )
+        return dirs, entries, links
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def refresh(self, root: PathLike, followlinks: bool = False, workers: Optional[int] = None) -> int:
+        """
+        Walk `root`, update the listings of changed directories and drop those
+        of directories under `root` that no longer exist. Returns the no. of files
+        """
+        seen = set()
+        num_files = 0
+        for p, files in _walk(root, followlinks, workers=workers, scandir=self.scandir):
+            seen.add(os.path.abspath(p))
+            num_files += len(files)
+
+        root = os.path.abspath(root)
+        with self.lock:
+            stored = self.conn.execute(
+                "SELECT path FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'",
+                (root, _escape_like(os.path.join(root, "")) + "%"),
+            ).fetchall()
+            stale = [(p,) for (p,) in stored if p not in seen]
+            self.conn.executemany("DELETE FROM dirs WHERE path = ?", stale)
+            self.conn.commit()
+
+        return num_files
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path})"
+
+
+def _split(x: str) -> List[str]:
+    return x.split(_SEP) if x else []
+
+
+def _escape_like(x: str) -> str:
+    return x.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _resolve_cache(cache: Union[bool, PathLike, FileListingCache, None]) -> Optional[FileListingCache]:
+    if cache is None or cache is False:     return None
+    if cache is True:                       return FileListingCache()
+    if isinstance(cache, FileListingCache): return cache
+    return FileListingCache(cache)
@@ -0,0 +1,82 @@
+import os
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Union
+from upyog.imports import PathLike
+
+
+__all__ = ["sniff_image_format", "sniff_image_files"]
+
+
+# No. of bytes needed to identify every format in `_detect_image_format`
+_HEADER_SIZE = 18
+
+# Sizes of the DIB header that follows the 14 byte "BM" file header, per BMP version
+_BMP_DIB_HEADER_SIZES = {12, 40, 52, 56, 108, 124}
+
+_ISOBMFF_IMAGE_BRANDS = {
+    b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1", b"avif", b"avis",
+}
+
+
+def _detect_image_format(header: bytes) -> Optional[str]:
+    "Identify an image from the magic number in its first bytes"
+    # fmt: off
+    if header[:3] == b"\xff\xd8\xff":                          return "jpeg"
+    if header[:8] == b"\x89PNG\r\n\x1a\n":                     return "png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):                   return "gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":      return "webp"
+    if header[:4] in (b"II*\x00", b"MM\x00*"):                 return "tiff"
+    if header[:2] == b"BM" and int.from_bytes(header[14:18], "little") in _BMP_DIB_HEADER_SIZES:
+        return "bmp"
+    if header[4:8] == b"ftyp" and header[8:12] in _ISOBMFF_IMAGE_BRANDS:
+        return "avif" if header[8:12] in (b"avif", b"avis") else "heic"
+    return None
+    # fmt: on
+
+
+def sniff_image_format(path: Union[PathLike, os.DirEntry]) -> Optional[str]:
+    """
+    Return the image format of `path` ("jpeg", "png", "gif", "webp", "tiff", "bmp",
+    "heic", "avif") by reading its first few bytes, or `None` if it isn't an image
+    (or can't be read). The file extension is ignored
+    """
+    try:
+        with open(path, "rb") as f:
+            return _detect_image_format(f.read(_HEADER_SIZE))
+    except OSError:
+        return None
+
+
+def _sniff_batch(files: list) -> List[bool]:
+    return [sniff_image_format(f) is not None for f in files]
+
+
+def sniff_image_files(
+    files: Iterable[Union[PathLike, os.DirEntry]],
+    workers: int = 16,
+    batch_size: int = 256,
+) -> Iterator[Union[PathLike, os.DirEntry]]:
+    """
+    Lazily filter `files` down to those whose contents are an image, reading only
+    the first bytes of each file. Files are read in batches of `batch_size` on a
+    pool of `workers` threads; the order of `files` is preserved
+    """
+    files = iter(files)
+    max_pending = workers * 2
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        while True:
+            while len(pending) < max_pending:
+                batch = [f for _, f in zip(range(batch_size), files)]
+                if not batch:
+                    break
+                pending.append((batch, executor.submit(_sniff_batch, batch)))
+
+            if not pending:
+                return
+
+            batch, future = pending.popleft()
+            yield from (f for f, is_image in zip(batch, future.result()) if is_image)
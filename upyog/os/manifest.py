@@ -0,0 +1,184 @@
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from pathlib import Path
+from typing import Collection, Iterable, Iterator, List, Optional, Union
+from upyog.os.read_files import PathLike, iter_files
+
+
+__all__ = ["FileManifest"]
+
+
+class FileManifest:
+    """
+    A compact, list-like collection of file paths for very large datasets.
+
+    Paths are stored as two Arrow columns: the parent directory (dictionary
+    encoded, so each directory is stored once) and the file name. There are no
+    Python objects per file, so a manifest of 100M files takes a fraction of
+    the memory of a `List[Path]`, and isn't duplicated page by page by refcount
+    updates in forked DataLoader workers.
+
+    Indexing returns a `Path` (or `str` if `return_str`) and slicing returns a new
+    `FileManifest`, so it can be used wherever a list of filenames is expected
+    """
+
+    def __init__(self, table: pa.Table, return_str: bool = False):
+        self.table = table.unify_dictionaries().combine_chunks()
+        self.return_str = return_str
+
+        if self.table.num_rows:
+            dir_col = self.table.column("dir").chunk(0)
+            self._dirs = dir_col.dictionary
+            self._dir_idx = dir_col.indices.to_numpy(zero_copy_only=False)
+            self._names = self.table.column("name").chunk(0)
+        else:
+            self._dirs = pa.array([], pa.large_string())
+            self._dir_idx = np.empty(0, np.int32)
+            self._names = pa.array([], pa.large_string())
+
+    @classmethod
+    def from_paths(
+        cls, paths: Iterable[PathLike], return_str: bool = False, chunk_size: int = 1_000_000
+    ) -> "FileManifest":
+        "Build a manifest from an iterable of paths without ever holding them all in memory"
+        dir2idx = {}
+        indices, names = [], []
+        chunk_idx, chunk_names = [], []
+
+        def flush():
+            indices.append(np.array(chunk_idx, dtype=np.int32))
+            names.append(pa.array(chunk_names, pa.large_string()))
+            chunk_idx.clear()
+            chunk_names.clear()
+
+        for p in paths:
+            d, n = os.path.split(os.fspath(p))
+            idx = dir2idx.get(d)
+            if idx is None:
+                idx = dir2idx[d] = len(dir2idx)
+            chunk_idx.append(idx)
+            chunk_names.append(n)
+            if len(chunk_names) >= chunk_size:
+                flush()
+        flush()
+
+        dirs = pa.DictionaryArray.from_arrays(
+            pa.array(np.concatenate(indices), pa.int32()),
+            pa.array(list(dir2idx), pa.large_string()),
+        )
+        table = pa.table({"dir": dirs, "name": pa.concat_arrays(names)})
+        return cls(table, return_str=return_str)
+
+    @classmethod
+    def from_folders(
+        cls,
+        folders: Union[PathLike, List[PathLike]],
+        extensions: Optional[Collection[str]] = None,
+        recurse: bool = True,
+        workers: Optional[int] = None,
+        cache=None,
+        return_str: bool = False,
+    ) -> "FileManifest":
+        "Build a manifest straight from a (streaming) listing of `folders`, see `get_files`"
+        if not isinstance(folders, list):
+            folders = [folders]
+        paths = (
+            f
+            for folder in folders
+            for f in iter_files(
+                folder, extensions, recurse=recurse, workers=workers, cache=cache, return_type="str"
+            )
+        )
+        return cls.from_paths(paths, return_str=return_str)
+
+    @classmethod
+    def load(cls, path: PathLike, return_str: bool = False) -> "FileManifest":
+        "Load a manifest saved with `FileManifest.save`"
+        table = pq.read_table(str(path), read_dictionary=["dir"])
+        table = table.cast(pa.schema([("dir", pa.dictionary(pa.int32(), pa.large_string())), ("name", pa.large_string())]))
+        return cls(table, return_str=return_str)
+
+    def save(self, path: PathLike):
+        "Save to a Parquet file"
+        pq.write_table(self.table, str(path))
+
+    def _get(self, i: int) -> Union[Path, str]:
+        f = os.path.join(self._dirs[self._dir_idx[i]].as_py(), self._names[i].as_py())
+        return f if self.return_str else Path(f)
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            if i.step not in (None, 1):
+                return self.take(np.arange(len(self))[i])
+            start, stop, _ = i.indices(len(self))
+            return FileManifest(self.table.slice(start, max(stop - start, 0)), self.return_str)
+        if isinstance(i, (list, np.ndarray, pa.Array)):
+            return self.take(i)
+
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("FileManifest index out of range")
+        return self._get(i)
+
+    def __iter__(self) -> Iterator[Union[Path, str]]:
+        for batch in self.table.to_batches(max_chunksize=65_536):
+            dirs = batch.column(0).dictionary.to_pylist()
+            idx = batch.column(0).indices.to_numpy(zero_copy_only=False)
+            for d, n in zip(idx, batch.column(1).to_pylist()):
+                f = os.path.join(dirs[d], n)
+                yield f if self.return_str else Path(f)
+
+    def take(self, indices) -> "FileManifest":
+        return FileManifest(self.table.take(indices), self.return_str)
+
+    def to_list(self) -> List[Union[Path, str]]:
+        return list(self)
+
+    def _sort_keys(self) -> pa.Array:
+        # Joining path components with '\0' (which sorts before every other
+        # character) gives the same order as sorting `Path` objects. Files with
+        # no folder are keyed by their bare name, and "/" already ends in a separator
+        prefixes = [
+            d.replace(os.sep, "\0") + ("" if d == "" or d.endswith(os.sep) else "\0")
+            for d in self._dirs.to_pylist()
+        ]
+        prefixes = pa.array(prefixes, pa.large_string())
+        return pc.binary_join_element_wise(
+            pc.take(prefixes, pa.array(self._dir_idx)), self._names, pa.scalar("", pa.large_string())
+        )
+
+    def sort(self) -> "FileManifest":
+        "Sort in place, in the same order as `sorted(List[Path])`"
+        self.__init__(self.table.take(pc.sort_indices(self._sort_keys())), self.return_str)
+        return self
+
+    def num_unique(self) -> int:
+        "No. of distinct paths, without sorting"
+        return pc.count_distinct(self._sort_keys()).as_py()
+
+    def dedupe(self) -> "FileManifest":
+        "Sort and drop duplicate paths in place"
+        self.sort()
+        if len(self) > 1:
+            keys = self._sort_keys()
+            is_new = pc.not_equal(keys.slice(1), keys.slice(0, len(keys) - 1))
+            keep = pa.concat_arrays([pa.array([True]), is_new])
+            self.__init__(self.table.filter(keep), self.return_str)
+        return self
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.nbytes
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self)} files, {len(self._dirs)} folders)"
+
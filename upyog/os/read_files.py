@@ -1,12 +1,20 @@
 from upyog.imports import *
-from upyog.utils.utils import flatten
+from upyog.os.file_types import sniff_image_files
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from fnmatch import translate as glob_to_regex
 
 
 """
 Taken from fastaiv1: https://github.com/fastai/fastai1/blob/a8327427ad5137c4899a1b4f74745193c9ea5be3/fastai/data_block.py#L22-L47
 """
 
-__all__ = ["PathLike", "get_files", "get_image_files", "get_video_files", "collate_image_filenames"]
+__all__ = [
+    "PathLike", "get_files", "iter_files", "get_image_files", "iter_image_files",
+    "get_video_files", "collate_image_filenames",
+]
+
+# Glob string(s) and / or compiled regex(es) to match folder names with
+DirPatterns = Union[str, re.Pattern, Collection[Union[str, re.Pattern]]]
 
 
 def get_files(
@@ -17,50 +25,228 @@ def get_files(
     include: Optional[Collection[str]] = None,
     presort: bool = False,
     followlinks: bool = False,
-) -> List[Path]:
+    lazy: bool = False,
+    workers: Optional[int] = None,
+    cache: Union[bool, PathLike, "FileListingCache", None] = None,
+    return_type: Literal["path", "str", "entry"] = "path",
+    prune: Optional[DirPatterns] = None,
+    max_depth: Optional[int] = None,
+) -> Union[List[Path], Iterator[Path]]:
     """
     Return list of files in `path` that have a suffix in `extensions`; optionally `recurse`.
     Use `include` and `exclude` for including/excluding folder names, `presort` to sort.
+    If `lazy`, return a generator that yields files as they are discovered (see `iter_files`)
+    Use `workers` > 1 to list directories concurrently when recursing. This returns the same
+    files as the serial walk, but in a non-deterministic order (use `presort` if it matters)
+    Pass `cache` (`True` for the default location, a path to a SQLite file, or a `FileListingCache`)
+    to reuse the listings of directories that haven't changed since the last recursive walk
+    `return_type` is one of "path" (`pathlib.Path`), "str", or "entry" (`os.DirEntry`, with cached `stat`).
+    Skipping `Path` creation with "str" / "entry" is considerably faster for millions of files
+    `prune` takes glob strings (e.g. "cache", "*thumbnails*") and/or compiled regexes, matched
+    against the full folder name at _every_ depth. Matching folders are never read from disk.
+    `max_depth` limits how deep the walk goes (0 = only `path` itself)
     """
-    # fmt: off
+    args = (path, extensions, recurse, exclude, include, followlinks, workers, cache, return_type, prune, max_depth)
+    if lazy:
+        if presort: raise ValueError("`presort` requires the full listing and can't be used with `lazy=True`")
+        return iter_files(*args)
+
+    res = list(iter_files(*args))
+    if presort: res = sorted(res, key=lambda p: _path_to_same_str(p), reverse=False)
+    return res
+
+
+def iter_files(
+    path: PathLike,
+    extensions: Collection[str] = None,
+    recurse: bool = False,
+    exclude: Optional[Collection[str]] = None,
+    include: Optional[Collection[str]] = None,
+    followlinks: bool = False,
+    workers: Optional[int] = None,
+    cache: Union[bool, PathLike, "FileListingCache", None] = None,
+    return_type: Literal["path", "str", "entry"] = "path",
+    prune: Optional[DirPatterns] = None,
+    max_depth: Optional[int] = None,
+) -> Iterator[Path]:
+    """
+    Generator version of `get_files`. Files are yielded directory by directory as
+    the walk discovers them, so the full listing is never held in memory
+    """
+    if return_type not in ("path", "str", "entry"):
+        raise ValueError(f"Expected `return_type` to be one of 'path', 'str', 'entry', got '{return_type}'")
+    extensions = _normalise_extensions(extensions)
+
     if recurse:
-        res = []
-        for i,(p,d,f) in enumerate(os.walk(path, followlinks=followlinks)):
-            # skip hidden dirs
-            if include is not None and i==0:   d[:] = [o for o in d if o in include]
-            elif exclude is not None and i==0: d[:] = [o for o in d if o not in exclude]
-            else:                              d[:] = [o for o in d if not o.startswith('.')]
-            res += _get_files(path, p, f, extensions)
-        if presort: res = sorted(res, key=lambda p: _path_to_same_str(p), reverse=False)
-        return res
+        from upyog.os.file_index import FileListingCache, _resolve_cache
+
+        file_cache = _resolve_cache(cache)
+        scandir = file_cache.scandir if file_cache else _scandir
+        try:
+            for p, entries in _walk(path, followlinks, include, exclude, workers, scandir, prune, max_depth):
+                yield from _get_files(p, entries, extensions, return_type)
+        finally:
+            if file_cache is not None:
+                # Only close connections that we opened here
+                if isinstance(cache, FileListingCache): file_cache.commit()
+                else:                                   file_cache.close()
     else:
-        f = [o.name for o in os.scandir(path) if o.is_file()]
-        res = _get_files(path, path, f, extensions)
-        if presort: res = sorted(res, key=lambda p: _path_to_same_str(p), reverse=False)
-        return res
+        with os.scandir(path) as it:
+            entries = [o for o in it if o.is_file()]
+        yield from _get_files(path, entries, extensions, return_type)
+
+
+def _scandir(path: str) -> Tuple[List[str], List[os.DirEntry], Set[str]]:
+    "Read `path` once and return (subdir names, file entries, names of symlinked subdirs)"
+    dirs, files, links = [], [], set()
+    with os.scandir(path) as it:
+        for entry in it:
+            try:    is_dir = entry.is_dir()
+            except OSError: is_dir = False
+            if is_dir:
+                dirs.append(entry.name)
+                if entry.is_symlink(): links.add(entry.name)
+            else:
+                files.append(entry)
+    return dirs, files, links
+
+
+def _compile_patterns(
+    patterns: Optional[DirPatterns]
+) -> Optional[Callable[[str], bool]]:
+    "Compile glob strings and regexes once into a function that checks if a name fully matches any of them"
+    if patterns is None:
+        return None
+    if isinstance(patterns, (str, re.Pattern)):
+        patterns = [patterns]
+
+    globs = [glob_to_regex(p) for p in patterns if isinstance(p, str)]
+    regexes = [p for p in patterns if isinstance(p, re.Pattern)]
+    if globs:
+        regexes.append(re.compile("|".join(globs)))
+    return lambda name: any(r.fullmatch(name) for r in regexes)
+
+
+def _filter_dirs(dirs: List[str], depth: int, include, exclude, prune=None, max_depth=None) -> List[str]:
+    # fmt: off
+    if max_depth is not None and depth >= max_depth: return []
+
+    # skip hidden dirs
+    if include is not None and depth==0:   dirs = [o for o in dirs if o in include]
+    elif exclude is not None and depth==0: dirs = [o for o in dirs if o not in exclude]
+    else:                                  dirs = [o for o in dirs if not o.startswith('.')]
+
+    if prune is not None:                  dirs = [o for o in dirs if not prune(o)]
+    return dirs
     # fmt: on
 
 
+def _walk(
+    top: PathLike,
+    followlinks: bool = False,
+    include: Optional[Collection[str]] = None,
+    exclude: Optional[Collection[str]] = None,
+    workers: Optional[int] = None,
+    scandir: Callable = _scandir,
+    prune=None,
+    max_depth: Optional[int] = None,
+) -> Iterator[Tuple[str, List[os.DirEntry]]]:
+    """
+    Top-down walk of `top` yielding `(dirpath, file_entries)`. Follows the same
+    rules as `os.walk`: unreadable directories are skipped, and symlinked
+    directories are only entered if `followlinks`. `scandir` lists a single
+    directory, see `_scandir`. See `get_files` for the rest
+    """
+    filter_dirs = partial(
+        _filter_dirs, include=include, exclude=exclude, prune=_compile_patterns(prune), max_depth=max_depth
+    )
+    if workers is not None and workers > 1:
+        yield from _walk_parallel(top, followlinks, filter_dirs, workers, scandir)
+        return
+
+    stack = [(os.fspath(top), 0)]
+    while stack:
+        p, depth = stack.pop()
+        try:
+            dirs, files, links = scandir(p)
+        except OSError:
+            continue
+        yield p, files
+
+        dirs = filter_dirs(dirs, depth)
+        for d in reversed(dirs):
+            if followlinks or d not in links:
+                stack.append((os.path.join(p, d), depth + 1))
+
+
+def _walk_parallel(top, followlinks, filter_dirs: Callable, workers: int, scandir: Callable = _scandir):
+    """
+    `_walk` where directories are read by a pool of `workers` threads. Every
+    listed subdirectory goes back on the shared queue, so idle threads always
+    pick up whatever work is left. `scandir` releases the GIL, which is what
+    makes this worthwhile on high latency (network) filesystems
+    """
+    backlog = [(os.fspath(top), 0)]
+    pending = {}
+    max_pending = workers * 4
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            while backlog or pending:
+                while backlog and len(pending) < max_pending:
+                    p, depth = backlog.pop()
+                    pending[executor.submit(scandir, p)] = (p, depth)
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    p, depth = pending.pop(future)
+                    try:
+                        dirs, files, links = future.result()
+                    except OSError:
+                        continue
+                    yield p, files
+
+                    for d in filter_dirs(dirs, depth):
+                        if followlinks or d not in links:
+                            backlog.append((os.path.join(p, d), depth + 1))
+        finally:
+            for future in pending:
+                future.cancel()
+
+
 def _path_to_same_str(p_fn: PathLike) -> str:
     "path -> str, but same on nt+posix, for alpha-sort only"
-    s_fn = str(p_fn)
+    s_fn = os.fspath(p_fn)
     s_fn = s_fn.replace("\\", ".")
     s_fn = s_fn.replace("/", ".")
     return s_fn
 
 
-def _get_files(parent, p, f, extensions) -> list:
-    p = Path(p)  # .relative_to(parent)
+def _normalise_extensions(extensions: Optional[Collection[str]]) -> Optional[FrozenSet[str]]:
+    "Lowercase `extensions` once per listing instead of once per directory"
+    if extensions is None:
+        return None
     if isinstance(extensions, str):
         extensions = [extensions]
-    low_extensions = [e.lower() for e in extensions] if extensions is not None else None
-    res = [
-        p / o
-        for o in f
-        if not o.startswith(".")
-        and (extensions is None or f'.{o.split(".")[-1].lower()}' in low_extensions)
-    ]
-    return res
+    return frozenset(e.lower() for e in extensions)
+
+
+def _get_files(p: PathLike, entries: List[os.DirEntry], extensions: Optional[FrozenSet[str]], return_type="path") -> list:
+    # Same suffix semantics as before: the text after the last '.', or the whole name if there's none
+    if extensions is None:
+        entries = [e for e in entries if not e.name.startswith(".")]
+    else:
+        entries = [
+            e for e in entries
+            if not e.name.startswith(".")
+            and "." + e.name.rpartition(".")[2].lower() in extensions
+        ]
+
+    if   return_type == "entry": return entries
+    elif return_type == "str":   return [e.path for e in entries]
+    else:
+        p = Path(p)
+        return [p / e.name for e in entries]
 
 
 _IMAGE_EXTENSIONS = set(
@@ -76,24 +262,58 @@ def get_image_files(
     include: Optional[List[str]] = None,
     exclude: Optional[List[str]] = None,
     recurse: bool = True,
-) -> List[Path]:
+    lazy: bool = False,
+    workers: Optional[int] = None,
+    cache: Union[bool, PathLike, "FileListingCache", None] = None,
+    return_type: Literal["path", "str", "entry"] = "path",
+    sniff: bool = False,
+    prune: Optional[DirPatterns] = None,
+    max_depth: Optional[int] = None,
+) -> Union[List[Path], Iterator[Path]]:
+    """
+    Return all image files in `path`, see `get_files` for the arguments.
+    By default, images are identified by their extension. With `sniff`, every file is
+    identified by the magic number in its first bytes instead, which also finds images
+    without (or with the wrong) extension, and skips non-images named like one
+    """
+    files = iter_image_files(
+        path, include=include, exclude=exclude, recurse=recurse, workers=workers, cache=cache,
+        return_type=return_type, sniff=sniff, prune=prune, max_depth=max_depth,
+    )
+    return files if lazy else list(files)
+
 
+def iter_image_files(
+    path: Union[PathLike, List[PathLike]],
+    include: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None,
+    recurse: bool = True,
+    workers: Optional[int] = None,
+    cache: Union[bool, PathLike, "FileListingCache", None] = None,
+    return_type: Literal["path", "str", "entry"] = "path",
+    sniff: bool = False,
+    prune: Optional[DirPatterns] = None,
+    max_depth: Optional[int] = None,
+) -> Iterator[Path]:
+    "Generator version of `get_image_files`"
     if not isinstance(path, list):
         path = [path]
 
     paths = path  # For backward compatibility
-    all_files = []
     for path in paths:
-        files = get_files(
+        files = iter_files(
             path=path,
             include=include,
             exclude=exclude,
             recurse=recurse,
-            extensions=_IMAGE_EXTENSIONS,
+            extensions=None if sniff else _IMAGE_EXTENSIONS,
+            workers=workers,
+            cache=cache,
+            return_type=return_type,
+            prune=prune,
+            max_depth=max_depth,
         )
-        all_files += files
-
-    return flatten(files)
+        yield from sniff_image_files(files, workers=workers or 16) if sniff else files
 
 
 def get_video_files(
@@ -116,11 +336,36 @@ def collate_image_filenames(
     img_folders: Optional[List[os.PathLike]] = None,
     sort: bool = True,
     return_str: bool = False,
-) -> List[PathLike]:
+    cache: Union[bool, PathLike, "FileListingCache", None] = None,
+    return_manifest: bool = False,
+) -> Union[List[PathLike], "FileManifest"]:
     """
     Take a list of `fnames` and `img_folders`, and return a flattened list of
     all image files in `img_folders` and `fnames` as a single list
+    Use `return_manifest` to get a compact `FileManifest` instead of a list, for huge datasets
     """
+    if img_folders is not None:
+        if isinstance(img_folders, (str, Path)):
+            img_folders = [img_folders]
+        for folder in img_folders:
+            if not Path(folder).exists():
+                raise FileNotFoundError(f"{folder} not found on disk.")
+
+    if return_manifest:
+        from upyog.os.manifest import FileManifest
+
+        if filenames is not None:
+            assert isinstance(filenames, list)
+        files = (
+            f
+            for files in [filenames or []] + [
+                iter_image_files(folder, cache=cache, return_type="str") for folder in img_folders or []
+            ]
+            for f in files
+        )
+        manifest = FileManifest.from_paths(files, return_str=return_str)
+        return manifest.sort() if sort else manifest
+
     all_files = []
     if filenames is not None:
         assert isinstance(filenames, list)
@@ -128,13 +373,8 @@ def collate_image_filenames(
         all_files.extend(filenames)
 
     if img_folders is not None:
-        if isinstance(img_folders, (str, Path)):
-            img_folders = [img_folders]
-        for folder in img_folders:
-            if not Path(folder).exists():
-                raise FileNotFoundError(f"{folder} not found on disk.")
         for folder in img_folders:
-            all_files.extend(get_image_files(folder))
+            all_files.extend(get_image_files(folder, cache=cache))
 
     if sort:
         all_files = sorted(all_files)
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import numpy as np
+
+from array import array
+
+from pathlib import Path
+from typing import Collection, List, Optional, Union
+from typing_extensions import Literal
+from upyog.os.manifest import FileManifest
+from upyog.os.read_files import PathLike, iter_files
+from upyog.os.utils import write_json
+
+
+__all__ = ["write_shard_manifests", "shard_manifest_path", "load_shard_manifest"]
+
+
+# With `balance="size"`, files are hashed into this many buckets per shard and
+# whole buckets are then distributed across the shards
+_BUCKETS_PER_SHARD = 64
+
+
+def shard_manifest_path(output_dir: PathLike, shard: int, num_shards: int) -> Path:
+    return Path(output_dir) / f"shard-{shard:05d}-of-{num_shards:05d}.parquet"
+
+
+def load_shard_manifest(output_dir: PathLike, shard: int, num_shards: int, return_str: bool = False) -> FileManifest:
+    "Load the manifest for `shard` (e.g. the node rank) written by `write_shard_manifests`"
+    return FileManifest.load(shard_manifest_path(output_dir, shard, num_shards), return_str=return_str)
+
+
+def _stable_hash(key: str) -> int:
+    "Unlike `hash`, the same across processes and runs"
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8", "surrogateescape"), digest_size=8).digest(), "little")
+
+
+def _assign_buckets(bucket_sizes: np.ndarray, num_shards: int) -> np.ndarray:
+    "Greedily assign buckets, largest first, to the shard with the fewest bytes so far"
+    bucket2shard = np.zeros(len(bucket_sizes), dtype=np.int64)
+    shard_sizes = np.zeros(num_shards, dtype=np.int64)
+    for b in np.argsort(-bucket_sizes, kind="stable"):
+        shard = int(np.argmin(shard_sizes))
+        bucket2shard[b] = shard
+        shard_sizes[shard] += bucket_sizes[b]
+    return bucket2shard
+
+
+def write_shard_manifests(
+    roots: Union[PathLike, List[PathLike]],
+    output_dir: PathLike,
+    num_shards: int,
+    balance: Literal["count", "size"] = "count",
+    extensions: Optional[Collection[str]] = None,
+    workers: Optional[int] = None,
+    cache=None,
+) -> List[Path]:
+    """
+    Walk `roots` once and split the files into `num_shards` `FileManifest`s saved
+    in `output_dir`, so that each worker / node can load its own shard
+    (see `load_shard_manifest`) instead of walking the whole tree again.
+
+    A file is assigned by hashing its path relative to its root, so re-running on
+    the same files gives the same split, and moving the roots elsewhere doesn't
+    change it.
+    * `balance="count"`: shard = hash % `num_shards`. A file stays in the same shard
+                         even as other files are added / removed
+    * `balance="size"`:  files are hashed into many small buckets, and buckets are
+                         distributed to balance the total bytes per shard. The size
+                         comes from the `stat` done while listing. Since that depends
+                         on the size of every bucket, adding / removing files can move
+                         whole buckets to other shards
+    """
+    if balance not in ("count", "size"):
+        raise ValueError(f"Expected `balance` to be 'count' or 'size', got '{balance}'")
+    if not isinstance(roots, list):
+        roots = [roots]
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    num_buckets = num_shards * _BUCKETS_PER_SHARD if balance == "size" else num_shards
+
+    # `array`s rather than lists, to avoid a Python int per file
+    buckets, sizes = array("q"), array("q")
+
+    def walk():
+        for root in roots:
+            root = os.path.abspath(root)
+            prefix_len = len(os.path.join(root, ""))
+            for entry in iter_files(
+                root, extensions, recurse=True, workers=workers, cache=cache, return_type="entry"
+            ):
+                path = entry.path
+                buckets.append(_stable_hash(path[prefix_len:]) % num_buckets)
+                if balance == "size":
+                    sizes.append(entry.stat().st_size)
+                yield path
+
+    manifest = FileManifest.from_paths(walk(), return_str=True)
+    buckets = np.frombuffer(buckets, dtype=np.int64)
+    sizes = np.frombuffer(sizes, dtype=np.int64) if balance == "size" else None
+
+    if balance == "size":
+        bucket2shard = _assign_buckets(np.bincount(buckets, weights=sizes, minlength=num_buckets), num_shards)
+        shards = bucket2shard[buckets]
+    else:
+        shards = buckets
+
+    summary = {"num_shards": num_shards, "balance": balance, "roots": [str(r) for r in roots], "shards": []}
+    output_files = []
+    for shard in range(num_shards):
+        idxs = np.flatnonzero(shards == shard)
+        shard_manifest = manifest.take(idxs).sort()
+        output_file = shard_manifest_path(output_dir, shard, num_shards)
+        shard_manifest.save(output_file)
+        output_files.append(output_file)
+        summary["shards"].append({
+            "file": output_file.name,
+            "num_files": len(idxs),
+            "num_bytes": int(sizes[idxs].sum()) if sizes is not None else None,
+        })
+
+    write_json(summary, output_dir / "shards.json")
+    return output_files
@@ -0,0 +1,133 @@
+import mmap
+import os
+import tarfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+from upyog.os.read_files import PathLike
+
+
+__all__ = ["build_tar_index", "tar_index_path", "TarMemberReader"]
+
+
+def tar_index_path(tar_file: PathLike) -> Path:
+    "The index sidecar of `tar_file` e.g. shard.tar -> shard.tar.index.parquet"
+    tar_file = Path(tar_file)
+    return tar_file.with_name(tar_file.name + ".index.parquet")
+
+
+def _index_table(names: List[str], offsets: List[int], sizes: List[int], st: os.stat_result) -> pa.Table:
+    table = pa.table({
+        "name": pa.array(names, pa.large_string()),
+        "offset": pa.array(offsets, pa.int64()),
+        "size": pa.array(sizes, pa.int64()),
+    })
+    # The .tar file the index was built from, to detect stale indexes
+    return table.replace_schema_metadata({"tar_size": str(st.st_size), "tar_mtime_ns": str(st.st_mtime_ns)})
+
+
+def _matches_tar(metadata: Optional[dict], st: os.stat_result) -> bool:
+    metadata = metadata or {}
+    return (
+        int(metadata.get(b"tar_size", -1)) == st.st_size
+        and int(metadata.get(b"tar_mtime_ns", -1)) == st.st_mtime_ns
+    )
+
+
+def _is_index_current(tar_file: PathLike, index_path: Optional[PathLike] = None) -> bool:
+    "Whether the index of `tar_file` exists and was built from its current version"
+    index_path = Path(index_path) if index_path else tar_index_path(tar_file)
+    if not index_path.exists():
+        return False
+    return _matches_tar(pq.read_schema(str(index_path)).metadata, os.stat(tar_file))
+
+
+def build_tar_index(tar_file: PathLike, index_path: Optional[PathLike] = None) -> Path:
+    """
+    Save the name, data offset and size of every file in the (uncompressed) `tar_file`
+    to a Parquet sidecar (see `tar_index_path`), reading only the tar headers.
+    Use `TarMemberReader` to then read single members without scanning the archive
+    """
+    index_path = Path(index_path) if index_path else tar_index_path(tar_file)
+    names, offsets, sizes = [], [], []
+    with open(tar_file, "rb") as f:
+        st = os.fstat(f.fileno())
+        # "r:" only accepts uncompressed archives, where offsets can be seeked to
+        with tarfile.open(fileobj=f, mode="r:") as tar:
+            for member in tar:
+                if member.isfile():
+                    names.append(member.name)
+                    offsets.append(member.offset_data)
+                    sizes.append(member.size)
+
+    table = _index_table(names, offsets, sizes, st)
+    partial_path = index_path.with_name(index_path.name + ".partial")
+    pq.write_table(table, str(partial_path))
+    os.replace(partial_path, index_path)
+    return index_path
+
+
+class TarMemberReader:
+    """
+    Random access to the members of an uncompressed tar file, using the index
+    written by `build_tar_index` (built on the fly if there's none).
+
+    With `use_mmap`, `reader[name]` is a zero-copy `memoryview` into a memory map of
+    the archive (release it before `close`-ing the reader). Otherwise, it's the
+    `bytes` of a single `os.pread`, which is safe to share between threads
+    """
+
+    def __init__(self, tar_file: PathLike, index_path: Optional[PathLike] = None, use_mmap: bool = True):
+        self.tar_file = Path(tar_file)
+        index_path = Path(index_path) if index_path else tar_index_path(tar_file)
+        if not index_path.exists():
+            build_tar_index(tar_file, index_path)
+
+        self.fd = os.open(self.tar_file, os.O_RDONLY)
+        st = os.fstat(self.fd)
+        table = pq.read_table(str(index_path))
+        if not _matches_tar(table.schema.metadata, st):
+            os.close(self.fd)
+            raise ValueError(f"{index_path} is out of date with {self.tar_file}, rebuild it with `build_tar_index`")
+
+        offsets = table.column("offset").to_pylist()
+        sizes = table.column("size").to_pylist()
+        self.members: Dict[str, Tuple[int, int]] = dict(zip(table.column("name").to_pylist(), zip(offsets, sizes)))
+        self.mmap = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ) if use_mmap and st.st_size else None
+
+    def read(self, name: str) -> Union[memoryview, bytes]:
+        offset, size = self.members[name]
+        if self.mmap is not None:
+            return memoryview(self.mmap)[offset : offset + size]
+        return os.pread(self.fd, size, offset)
+
+    def __getitem__(self, name: str) -> Union[memoryview, bytes]:
+        return self.read(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.members
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def names(self) -> List[str]:
+        return list(self.members)
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.tar_file}, {len(self)} members)"
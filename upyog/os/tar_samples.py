@@ -0,0 +1,146 @@
+import io
+import json
+import os
+import random
+import tarfile
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from upyog.os.read_files import PathLike, _IMAGE_EXTENSIONS
+
+
+__all__ = ["TarSampleReader", "iter_tar_samples", "split_key"]
+
+
+def split_key(name: str) -> Tuple[str, str]:
+    """
+    Split a tar member name into its sample key and suffix, the way WebDataset
+    groups files: everything from the first '.' of the file name is the suffix
+        "0001/abc.url.txt" -> ("0001/abc", ".url.txt")
+    """
+    dirname, base = os.path.split(name)
+    i = base.find(".")
+    if i < 0:
+        return name, ""
+    return os.path.join(dirname, base[:i]), base[i:]
+
+
+def _suffix_to_field(suffix: str) -> str:
+    "e.g. '.url.txt' -> 'url_txt__data', the subfolder names of `extract-and-organise-tar-archive`"
+    return suffix[1:].replace(".", "_") + "__data"
+
+
+def _decode(suffix: str, data: bytes) -> Any:
+    "Images -> `PIL.Image` (RGB), .json -> dict, .txt / .cls -> str, anything else is left as bytes"
+    ext = suffix[suffix.rfind(".") :].lower()
+    if ext in _IMAGE_EXTENSIONS:
+        from upyog.image.io import load_image
+
+        return load_image(io.BytesIO(data))
+    if ext == ".json":
+        return json.loads(data)
+    if ext in (".txt", ".cls"):
+        return data.decode("utf-8")
+    return data
+
+
+def iter_tar_samples(
+    tar_file: PathLike,
+    extract_structure: Optional[Dict[str, str]] = None,
+    decode: Union[bool, Callable[[str, bytes], Any]] = False,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Read `tar_file` sequentially and yield one dict per sample, i.e. per group of
+    consecutive members with the same key (see `split_key`). Each file of a sample
+    is stored under `extract_structure[suffix]` (by default, the same subfolder names
+    `detect_structure` gives e.g. "url_txt__data"); suffixes that aren't in a given
+    `extract_structure` are dropped. Samples also have "__key__" and "__shard__".
+
+    With `decode=True`, images are loaded as `PIL.Image`s, JSON is parsed and text
+    is decoded (see `_decode`). Pass a `decode(suffix, bytes)` function to customise it
+    """
+    if decode is True:
+        decode = _decode
+
+    shard = os.fspath(tar_file)
+    sample = None
+    with tarfile.open(tar_file, "r|*") as tar:
+        for member in tar:
+            if not member.isfile() or os.path.basename(member.name).startswith("."):
+                continue
+            key, suffix = split_key(member.name)
+
+            if extract_structure is None:   field = _suffix_to_field(suffix)
+            elif suffix in extract_structure: field = extract_structure[suffix]
+            else:                             continue
+
+            if sample is None or sample["__key__"] != key:
+                if sample is not None:
+                    yield sample
+                sample = {"__key__": key, "__shard__": shard}
+
+            data = tar.extractfile(member).read()
+            sample[field] = decode(suffix, data) if decode else data
+
+    if sample is not None:
+        yield sample
+
+
+def _get_worker_info() -> Tuple[int, int]:
+    "(worker id, no. of workers) of the current PyTorch DataLoader worker, or (0, 1)"
+    try:
+        from torch.utils.data import get_worker_info
+    except ImportError:
+        return 0, 1
+    info = get_worker_info()
+    return (info.id, info.num_workers) if info is not None else (0, 1)
+
+
+class TarSampleReader:
+    """
+    Stream samples (see `iter_tar_samples`) from a list of tar shards, reading each
+    shard once, sequentially, without extracting it.
+
+    Shards (not samples) are shuffled with `shuffle_shards`, using `seed` + the epoch
+    (see `set_epoch`) so every process agrees on the order. They are then split between
+    the `rank`s of a distributed job (defaults to the `RANK` / `WORLD_SIZE` env vars),
+    and between the workers of a PyTorch `DataLoader`, so each shard is read by exactly
+    one worker. To use with a `DataLoader`, wrap it in an `IterableDataset`
+    """
+
+    def __init__(
+        self,
+        shards: List[PathLike],
+        extract_structure: Optional[Dict[str, str]] = None,
+        decode: Union[bool, Callable[[str, bytes], Any]] = False,
+        shuffle_shards: bool = False,
+        seed: int = 0,
+        rank: Optional[int] = None,
+        world_size: Optional[int] = None,
+    ):
+        self.shards = sorted(shards)
+        self.extract_structure = extract_structure
+        self.decode = decode
+        self.shuffle_shards = shuffle_shards
+        self.seed = seed
+        self.rank = rank if rank is not None else int(os.environ.get("RANK", 0))
+        self.world_size = world_size if world_size is not None else int(os.environ.get("WORLD_SIZE", 1))
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def worker_shards(self) -> List[PathLike]:
+        "The shards read by this rank / DataLoader worker in the current epoch"
+        shards = list(self.shards)
+        if self.shuffle_shards:
+            random.Random(self.seed + self.epoch).shuffle(shards)
+        shards = shards[self.rank :: self.world_size]
+        worker_id, num_workers = _get_worker_info()
+        return shards[worker_id::num_workers]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for shard in self.worker_shards():
+            yield from iter_tar_samples(shard, self.extract_structure, self.decode)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self.shards)} shards, rank {self.rank}/{self.world_size})"
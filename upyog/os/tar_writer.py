@@ -0,0 +1,174 @@
+import os
+import tarfile
+import pyarrow.parquet as pq
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Collection, Dict, List, Optional, Tuple, Union
+from loguru import logger
+from tqdm.auto import tqdm
+from upyog.os.read_files import PathLike, iter_files
+from upyog.os.tar_index import _is_index_current, build_tar_index, tar_index_path
+from upyog.os.tar_samples import split_key
+
+
+__all__ = ["TarShard", "group_files_into_samples", "plan_tar_shards", "write_tar_shard", "write_tar_shards"]
+
+
+# (sample key, [(file path, member name, size)])
+Sample = Tuple[str, List[Tuple[str, str, int]]]
+
+
+@dataclass
+class TarShard:
+    path: Path
+    num_samples: int
+    num_bytes: int  # Of the files in the shard, excluding tar headers
+    skipped: bool = False  # Already existed
+
+
+def group_files_into_samples(
+    roots: Union[PathLike, List[PathLike]],
+    extensions: Optional[Collection[str]] = None,
+    workers: Optional[int] = None,
+) -> List[Sample]:
+    """
+    List the files in `roots` and group them into samples by their path relative to
+    their root up to the first '.' of the file name (see `split_key`), so that e.g.
+    `0001.jpg`, `0001.json` and `0001.url.txt` become one sample with key "0001",
+    even if they are in different roots (e.g. the subfolders written by
+    `extract-and-organise-tar-archive`). Samples are sorted by key; sizes come from
+    the `stat` cached while listing.
+
+    Raises a `ValueError` if two roots have a file with the same relative path,
+    as they would be written to the tar file under the same name
+    """
+    if not isinstance(roots, list):
+        roots = [roots]
+
+    samples: Dict[str, list] = {}
+    name2path: Dict[str, str] = {}
+    for root in roots:
+        prefix_len = len(os.path.join(os.path.abspath(root), ""))
+        for entry in iter_files(
+            os.path.abspath(root), extensions, recurse=True, workers=workers, return_type="entry"
+        ):
+            name = entry.path[prefix_len:].replace(os.sep, "/")
+            if name in name2path:
+                raise ValueError(
+                    f"{name2path[name]} and {entry.path} would both be written as '{name}', rename one of them"
+                )
+            name2path[name] = entry.path
+            key, _ = split_key(name)
+            samples.setdefault(key, []).append((entry.path, name, entry.stat().st_size))
+
+    return [(key, sorted(samples[key], key=lambda f: f[1])) for key in sorted(samples)]
+
+
+def plan_tar_shards(samples: List[Sample], shard_size: int) -> List[List[Sample]]:
+    "Split `samples` in order into shards of at most `shard_size` bytes (unless a single sample is bigger)"
+    shards, shard, size = [], [], 0
+    for sample in samples:
+        sample_size = sum(f[2] for f in sample[1])
+        if shard and size + sample_size > shard_size:
+            shards.append(shard)
+            shard, size = [], 0
+        shard.append(sample)
+        size += sample_size
+    if shard:
+        shards.append(shard)
+    return shards
+
+
+def write_tar_shard(samples: List[Sample], tar_path: PathLike, index: bool = True) -> TarShard:
+    """
+    Write `samples` to the uncompressed `tar_path`, via a `.partial` file so that
+    an interrupted write never leaves a truncated shard. With `index`, the
+    member index (see `build_tar_index`) is written next to it
+    """
+    tar_path = Path(tar_path)
+    partial_path = tar_path.with_name(tar_path.name + ".partial")
+    num_bytes = 0
+    try:
+        with tarfile.open(partial_path, "w", format=tarfile.PAX_FORMAT) as tar:
+            for _, files in samples:
+                for path, name, _ in files:
+                    with open(path, "rb") as f:
+                        info = tar.gettarinfo(arcname=name, fileobj=f)
+                        info.uid = info.gid = 0
+                        info.uname = info.gname = ""
+                        tar.addfile(info, f)
+                    num_bytes += info.size
+    except BaseException:
+        if partial_path.exists():  # `unlink(missing_ok=True)` is 3.8+
+            partial_path.unlink()
+        raise
+
+    os.replace(partial_path, tar_path)
+    if index:
+        build_tar_index(tar_path)
+    return TarShard(tar_path, len(samples), num_bytes)
+
+
+def _tar_member_names(tar_path: Path) -> List[str]:
+    "The file names in `tar_path`, from its index if it's up to date, otherwise from its headers"
+    if _is_index_current(tar_path):
+        return pq.read_table(str(tar_index_path(tar_path)), columns=["name"]).column("name").to_pylist()
+    with tarfile.open(tar_path, "r:") as tar:
+        return [m.name for m in tar if m.isfile()]
+
+
+def _is_shard_written(tar_path: Path, samples: List[Sample]) -> bool:
+    "Whether `tar_path` exists and holds exactly the files planned for it, in order"
+    if not tar_path.exists():
+        return False
+    try:
+        return _tar_member_names(tar_path) == [name for _, files in samples for _, name, _ in files]
+    except (OSError, tarfile.TarError):
+        return False
+
+
+def write_tar_shards(
+    roots: Union[PathLike, List[PathLike]],
+    output_dir: PathLike,
+    shard_size: int = 1024**3,
+    prefix: str = "shard",
+    extensions: Optional[Collection[str]] = None,
+    workers: int = 8,
+    index: bool = True,
+    overwrite: bool = False,
+    verbose: bool = True,
+) -> List[TarShard]:
+    """
+    Pack the files in `roots` into uncompressed tar shards of ~`shard_size` bytes
+    named `{prefix}-000000.tar`, ... in `output_dir`, with the files of a sample
+    (see `group_files_into_samples`) always in the same shard, next to each other.
+    Shards are written by `workers` threads. The split only depends on the files,
+    so when re-running, shards that already hold exactly the files planned for them
+    are skipped (unless `overwrite`). Others are rewritten e.g. all the shards after
+    a newly added file, as it moves the shard boundaries
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    shards = plan_tar_shards(group_files_into_samples(roots, extensions, workers), shard_size)
+
+    def write(i: int) -> TarShard:
+        tar_path = output_dir / f"{prefix}-{i:06d}.tar"
+        if not overwrite and _is_shard_written(tar_path, shards[i]):
+            if index and not _is_index_current(tar_path):
+                build_tar_index(tar_path)
+            num_bytes = sum(f[2] for _, files in shards[i] for f in files)
+            return TarShard(tar_path, len(shards[i]), num_bytes, skipped=True)
+        return write_tar_shard(shards[i], tar_path, index)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        written = list(tqdm(
+            executor.map(write, range(len(shards))), total=len(shards), desc="Writing tar shards", disable=not verbose
+        ))
+
+    planned = {s.path for s in written}
+    stale = sorted(p for p in output_dir.glob(f"{prefix}-*.tar") if p not in planned)
+    if stale:
+        logger.warning(f"{len(stale)} shards in {output_dir} aren't part of this run e.g. {stale[0].name}, remove them")
+    return written
@@ -0,0 +1,293 @@
+import errno
+import json
+import os
+import shutil
+import stat
+import time
+import uuid
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+from typing_extensions import Literal
+from loguru import logger
+from tqdm.auto import tqdm
+from upyog.os.read_files import PathLike
+from upyog.os.utils import read_jsonl
+
+
+__all__ = ["TransferStats", "transfer_file", "transfer_files"]
+
+
+TransferMode = Literal["copy", "move", "hardlink", "reflink"]
+
+# `ioctl` request to clone a file's extents (btrfs, XFS, ...) from `linux/fs.h`
+_FICLONE = 0x40049409
+_SENDFILE_CHUNK = 1 << 30
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF}
+
+
+@dataclass
+class TransferStats:
+    files: int = 0    # Files transferred
+    new: int = 0      # ... of which didn't exist in the output folder before
+    skipped: int = 0  # Already transferred (same file / in the journal)
+    failed: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        mb_per_sec = self.bytes / 1024**2 / max(self.seconds, 1e-9)
+        return (
+            f"{self.files} files transferred ({self.new} new), {self.skipped} skipped, {self.failed} failed, "
+            f"{self.bytes / 1024**2:.1f} MiB in {self.seconds:.1f}s ({mb_per_sec:.1f} MiB/s)"
+        )
+
+
+def _copy_fd(fsrc: int, fdst: int, size: int):
+    """
+    Copy `size` bytes between file descriptors in the kernel where possible:
+    `copy_file_range` (which can share extents / do server side copies), then
+    `sendfile`, and finally plain reads and writes
+    """
+    if hasattr(os, "copy_file_range"):
+        copied = 0
+        try:
+            while copied < size:
+                n = os.copy_file_range(fsrc, fdst, size - copied)
+                if n == 0:
+                    break
+                copied += n
+            return
+        except OSError as e:
+            if copied or e.errno not in _FALLBACK_ERRNOS:
+                raise
+
+    if hasattr(os, "sendfile"):
+        copied = 0
+        try:
+            while copied < size:
+                n = os.sendfile(fdst, fsrc, copied, min(size - copied, _SENDFILE_CHUNK))
+                if n == 0:
+                    break
+                copied += n
+            return
+        except OSError as e:
+            if copied or e.errno not in _FALLBACK_ERRNOS:
+                raise
+
+    with open(fsrc, "rb", closefd=False) as src, open(fdst, "wb", closefd=False) as dst:
+        shutil.copyfileobj(src, dst, 1024**2)
+
+
+def _reflink_fd(fsrc: int, fdst: int) -> bool:
+    "Clone `fsrc` into `fdst` (copy-on-write). Returns `False` if the filesystem can't"
+    try:
+        import fcntl
+
+        fcntl.ioctl(fdst, _FICLONE, fsrc)
+        return True
+    except (ImportError, OSError):
+        return False
+
+
+def _partial_path(dst: str) -> str:
+    "A unique, hidden (so `get_files` skips it) name next to `dst` to write to first"
+    dirname, name = os.path.split(dst)
+    return os.path.join(dirname, f".{name}.{uuid.uuid4().hex[:12]}.partial")
+
+
+def _put_in_place(partial: str, dst: str) -> bool:
+    """
+    Atomically move the finished `partial` file to `dst`, so that concurrent
+    transfers to the same `dst` never interleave and the last one wins.
+    Returns whether `dst` is new, which linking (unlike renaming) tells atomically
+    """
+    try:
+        os.link(partial, dst)
+    except FileExistsError:
+        os.replace(partial, dst)
+        return False
+    except OSError:  # Filesystems without hard links
+        is_new = not os.path.lexists(dst)
+        os.replace(partial, dst)
+        return is_new
+    os.unlink(partial)
+    return True
+
+
+def _copy(src: str, dst: str, reflink: bool = False) -> Tuple[int, bool]:
+    "Copy `src` to `dst` via a `_partial_path`. Returns `(no. of bytes, whether dst is new)`"
+    partial = _partial_path(dst)
+    try:
+        with open(src, "rb", buffering=0) as fsrc:
+            st = os.fstat(fsrc.fileno())
+            with open(partial, "xb", buffering=0) as fdst:
+                if not (reflink and _reflink_fd(fsrc.fileno(), fdst.fileno())):
+                    _copy_fd(fsrc.fileno(), fdst.fileno(), st.st_size)
+                os.fchmod(fdst.fileno(), stat.S_IMODE(st.st_mode))
+        return st.st_size, _put_in_place(partial, dst)
+    except BaseException:
+        if os.path.lexists(partial):
+            os.unlink(partial)
+        raise
+
+
+def transfer_file(src: PathLike, dst: PathLike, mode: TransferMode = "copy") -> Tuple[int, bool]:
+    """
+    Copy / move / link `src` to `dst`, overwriting `dst` if it exists.
+    * "copy":     in-kernel copy (see `_copy_fd`) + permission bits, like `shutil.copy`
+    * "move":     rename, falling back to copy + delete across filesystems
+    * "hardlink": hard link `dst` to `src` (same filesystem only)
+    * "reflink":  copy-on-write clone where the filesystem supports it (btrfs, XFS),
+                  otherwise a regular copy, like `cp --reflink=auto`
+
+    Copies and links are written to a temporary name next to `dst` and then
+    atomically put in place, so concurrent transfers to the same `dst` (e.g. files
+    with the same name from different folders) never corrupt it; the last one wins.
+
+    Returns `(no. of bytes, whether dst is new)`. Raises `shutil.SameFileError`
+    if `dst` is already the same file as `src`
+    """
+    src, dst = os.fspath(src), os.fspath(dst)
+    src_st = os.stat(src)
+    try:
+        dst_st = os.stat(dst)
+    except FileNotFoundError:
+        dst_st = None
+    if dst_st is not None and (dst_st.st_dev, dst_st.st_ino) == (src_st.st_dev, src_st.st_ino):
+        raise shutil.SameFileError(f"{src} and {dst} are the same file")
+    is_new = dst_st is None
+
+    if mode == "copy":
+        return _copy(src, dst)
+    if mode == "reflink":
+        return _copy(src, dst, reflink=True)
+    if mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return src_st.st_size, True
+        except FileExistsError:
+            partial = _partial_path(dst)
+            os.link(src, partial)
+            os.replace(partial, dst)
+            return src_st.st_size, False
+    if mode == "move":
+        try:
+            os.replace(src, dst)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            nbytes, is_new = _copy(src, dst)
+            os.unlink(src)
+        return src_st.st_size, is_new
+    raise ValueError(f"Expected `mode` to be one of 'copy', 'move', 'hardlink', 'reflink', got '{mode}'")
+
+
+def _transfer_batch(batch: List[Tuple[str, str]], mode: TransferMode) -> List[Tuple[Optional[int], bool, Optional[str]]]:
+    "`(no. of bytes or `None` if skipped, is new, error)` for each `(src, dst)` in `batch`"
+    results = []
+    for src, dst in batch:
+        try:
+            nbytes, is_new = transfer_file(src, dst, mode)
+            results.append((nbytes, is_new, None))
+        except shutil.SameFileError:
+            results.append((None, False, None))
+        except OSError as e:
+            results.append((None, False, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def _load_journal(journal: Path, mode: TransferMode) -> Set[Tuple[str, str]]:
+    "`(src, dst)`s successfully transferred with `mode` in a previous run"
+    return {
+        (record["src"], record["dst"])
+        for record in read_jsonl(journal)
+        if record["error"] is None and record.get("mode", mode) == mode
+    }
+
+
+def transfer_files(
+    files: Iterable[PathLike],
+    output_dir: PathLike,
+    mode: TransferMode = "copy",
+    workers: int = 8,
+    journal: Optional[PathLike] = None,
+    batch_size: int = 64,
+    verbose: bool = True,
+) -> TransferStats:
+    """
+    Copy / move / link `files` into the flat folder `output_dir` (see `transfer_file`
+    for the `mode`s) on a pool of `workers` threads. `files` can be a lazy iterable,
+    e.g. from `iter_files`; only a bounded no. of batches are in flight at once.
+
+    If `journal` (a .jsonl file) is given, each transfer is appended to it and
+    files already transferred to the same destination with the same `mode` are
+    skipped, so an interrupted run can be resumed.
+    The returned `TransferStats` are counted from the transfers themselves, the
+    output folder is never listed
+    """
+    if mode not in ("copy", "move", "hardlink", "reflink"):
+        raise ValueError(f"Expected `mode` to be one of 'copy', 'move', 'hardlink', 'reflink', got '{mode}'")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    journal = Path(journal) if journal else None
+    done = _load_journal(journal, mode) if journal else set()
+
+    stats = TransferStats()
+    start = time.time()
+    total = len(files) if hasattr(files, "__len__") else None
+
+    def iter_pairs():
+        for f in files:
+            src = os.fspath(f)
+            dst = os.path.join(output_dir, os.path.basename(src))
+            if (src, dst) in done:
+                stats.skipped += 1
+                continue
+            yield src, dst
+
+    pairs = iter_pairs()
+    max_pending = workers * 2
+    journal_file = open(journal, "a") if journal else None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor, tqdm(
+            total=total, desc=f"Transferring files ({mode})", disable=not verbose
+        ) as progress:
+            pending = deque()
+            while True:
+                while len(pending) < max_pending:
+                    batch = [p for _, p in zip(range(batch_size), pairs)]
+                    if not batch:
+                        break
+                    pending.append((batch, executor.submit(_transfer_batch, batch, mode)))
+
+                if not pending:
+                    break
+
+                batch, future = pending.popleft()
+                for (src, dst), (nbytes, is_new, error) in zip(batch, future.result()):
+                    if error is not None:
+                        stats.failed += 1
+                        logger.warning(f"Failed to transfer {src}: {error}")
+                    elif nbytes is None:
+                        stats.skipped += 1
+                    else:
+                        stats.files += 1
+                        stats.new += is_new
+                        stats.bytes += nbytes
+                    if journal_file:
+                        record = {"src": src, "dst": dst, "mode": mode, "error": error}
+                        journal_file.write(json.dumps(record) + "\n")
+                if journal_file:
+                    journal_file.flush()
+                progress.update(stats.files + stats.skipped + stats.failed - progress.n)
+    finally:
+        if journal_file:
+            journal_file.close()
+
+    stats.seconds = time.time() - start
+    return stats
@@ -7,19 +7,22 @@ import json
 import os
 import platform
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from upyog.os.read_files import PathLike, get_files
-from typing import List, Literal, Union, Optional
+from upyog.os.read_files import PathLike
+from upyog.os.disk_usage import disk_usage
+from typing import Dict, Iterator, List, Literal, Union, Optional
 from tqdm import tqdm
 from loguru import logger
 
 
 __all__ = [
-    "load_json", "read_json", "check_pil_simd_usage", "sanitise_filename", "get_file_size",
+    "load_json", "read_json", "read_jsonl", "check_pil_simd_usage", "sanitise_filename", "get_file_size",
     "get_file_creation_date", "write_json", "write_text",
     "is_platform_macos", "is_platform_windows", "is_platform_linux",
-    "convert_number_to_human_readable_format",
+    "convert_number_to_human_readable_format", "check_corrupted_images",
 ]
 
 
@@ -37,6 +40,21 @@ def read_json(path: PathLike):
     return load_json(path)
 
 
+def read_jsonl(path: PathLike) -> Iterator[dict]:
+    """
+    Yield the records of the JSON Lines file `path`, if it exists. Lines that aren't
+    valid JSON (e.g. the last one, if the process writing it was interrupted) are skipped
+    """
+    if not Path(path).exists():
+        return
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
 def write_json(json_data: dict, path: PathLike, indent=4):
     "Write `json_data` to `path`"
     with open(path, "w") as f:
@@ -65,13 +83,94 @@ def check_pil_simd_usage():
             )
 
 
-def check_corrupted_images(filepaths: List[PathLike], verbose=True) -> List[PathLike]:
+def _check_image(f: PathLike, full_decode: bool = False) -> Optional[str]:
+    "Return why `f` can't be read as an image, or `None` if it can"
     from PIL import Image
 
+    try:
+        with Image.open(f) as img:
+            if not full_decode:
+                return None
+            img.verify()
+        # `verify` leaves the image unusable, so it needs to be opened again to decode the pixels
+        with Image.open(f) as img:
+            img.load()
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def _check_images(files: List[PathLike], full_decode: bool) -> List[Optional[str]]:
+    from PIL import ImageFile
+
+    # `upyog.imports` sets this globally, which would let truncated files decode without errors
+    load_truncated = ImageFile.LOAD_TRUNCATED_IMAGES
+    ImageFile.LOAD_TRUNCATED_IMAGES = not full_decode and load_truncated
+    try:
+        return [_check_image(f, full_decode) for f in files]
+    finally:
+        ImageFile.LOAD_TRUNCATED_IMAGES = load_truncated
+
+
+def _load_journal(journal: Path, full_decode: bool) -> Dict[str, Optional[str]]:
+    "Results in `journal` from scans at least as strict as `full_decode`"
+    done = {}
+    for record in read_jsonl(journal):
+        if record.get("full_decode", False) >= full_decode:
+            done[record["path"]] = record["error"]
+    return done
+
+
+def check_corrupted_images(
+    filepaths: List[PathLike],
+    verbose=True,
+    full_decode: bool = False,
+    workers: Optional[int] = None,
+    journal: Optional[PathLike] = None,
+    batch_size: int = 64,
+) -> List[PathLike]:
+    """
+    Return the files in `filepaths` that can't be opened as images.
+
+    By default, only the image header is parsed. With `full_decode`, the file is
+    also `verify()`d and fully decoded (with `LOAD_TRUNCATED_IMAGES` off), which
+    catches truncated / corrupted data too, but is much slower.
+    Use `workers` to check files in batches of `batch_size` in a process pool.
+    If `journal` (a .jsonl file) is given, every result is appended to it, and files
+    already in it are skipped, so an interrupted scan picks up where it left off.
+    Results of header-only scans aren't reused by `full_decode` scans
+    """
+    journal = Path(journal) if journal else None
+    done = _load_journal(journal, full_decode) if journal else {}
+
     corrupted = []
-    for f in tqdm(filepaths, "Scanning files for corruptions", disable=not verbose):
-        try:    Image.open(f)
-        except: corrupted.append(f)
+    todo = []
+    for f in filepaths:
+        key = os.fspath(f)
+        if key in done:
+            if done[key] is not None: corrupted.append(f)
+        else:
+            todo.append(f)
+
+    if done and verbose:
+        logger.info(f"Skipping {len(filepaths) - len(todo)} files already in the journal {journal}")
+
+    journal_file = open(journal, "a") if journal else None
+    try:
+        batches = (todo[i : i + batch_size] for i in range(0, len(todo), batch_size))
+        with tqdm(total=len(todo), desc="Scanning files for corruptions", disable=not verbose) as progress:
+            for batch, errors in _map_batches(batches, full_decode, workers):
+                for f, error in zip(batch, errors):
+                    if error is not None:
+                        corrupted.append(f)
+                    if journal_file:
+                        journal_file.write(json.dumps({"path": os.fspath(f), "error": error, "full_decode": full_decode}) + "\n")
+                if journal_file:
+                    journal_file.flush()
+                progress.update(len(batch))
+    finally:
+        if journal_file:
+            journal_file.close()
 
     if verbose:
         logger.info(f"Found {len(corrupted)} corrupt files")
@@ -79,6 +178,25 @@ def check_corrupted_images(filepaths: List[PathLike], verbose=True) -> List[Path
     return corrupted
 
 
+def _map_batches(batches: Iterator[list], full_decode: bool, workers: Optional[int]):
+    "Yield `(batch, errors)`, checking batches in a process pool if `workers`"
+    if not workers or workers <= 1:
+        for batch in batches:
+            yield batch, _check_images(batch, full_decode)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, executor.submit(_check_images, batch, full_decode)))
+            if len(pending) >= workers * 4:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+        while pending:
+            batch, future = pending.popleft()
+            yield batch, future.result()
+
+
 # fmt: off
 def sanitise_filename(
     f: str, lowercase=False, prefix=None, truncate: Optional[int] = 240
@@ -101,10 +219,16 @@ def sanitise_filename(
     return fn
 
 
-def get_file_size(path: PathLike, units: Literal["B", "KB", "MB", "GB"] = "MB"):
+def get_file_size(
+    path: PathLike,
+    units: Literal["B", "KB", "MB", "GB"] = "MB",
+    workers: Optional[int] = 8,
+    dedupe_hardlinks: bool = False,
+):
+    "Size of a file, or of all the files in a folder (see `disk_usage` for the breakdown)"
     path = Path(path)
     if path.is_dir():
-        B = sum(os.path.getsize(f) for f in get_files(path, recurse=True))
+        B = disk_usage(path, workers=workers, dedupe_hardlinks=dedupe_hardlinks).bytes
     else:
         B = os.path.getsize(path)
 
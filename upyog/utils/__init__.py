@@ -5,3 +5,4 @@ from .zip_utils import *
 from .prettify_df import *
 from .date_utils import *
 from .dictionary import Dictionary
+from .hashing import *
@@ -0,0 +1,251 @@
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+from loguru import logger
+from tqdm.auto import tqdm
+from upyog.imports import PathLike, is_package_available
+
+
+__all__ = ["hash_file", "hash_files", "HashCache", "available_hash_algorithms", "find_duplicate_files"]
+
+
+IS_XXHASH_AVAILABLE = is_package_available("xxhash")
+DEFAULT_HASH_CACHE = Path.home() / ".cache" / "upyog" / "file_hashes.sqlite"
+
+# Files at least this big are hashed from an `mmap` rather than with buffered reads
+_MMAP_THRESHOLD = 64 * 1024**2
+_XXHASH_ALGORITHMS = ["xxh64", "xxh3_64", "xxh3_128", "xxh128"]
+
+
+def available_hash_algorithms() -> List[str]:
+    "Algorithms accepted by `hash_file`. `xxhash` ones are only available if it is installed"
+    return sorted(hashlib.algorithms_guaranteed) + (_XXHASH_ALGORITHMS if IS_XXHASH_AVAILABLE else [])
+
+
+def _new_hasher(algorithm: str):
+    if algorithm in _XXHASH_ALGORITHMS:
+        if not IS_XXHASH_AVAILABLE:
+            raise ImportError(f"'{algorithm}' requires `xxhash`. Install it with `pip install xxhash`")
+        import xxhash
+
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def hash_file(
+    path: PathLike,
+    algorithm: str = "blake2b",
+    chunk_size: int = 8 * 1024**2,
+    max_bytes: Optional[int] = None,
+) -> str:
+    """
+    Return the hex digest of the contents of `path` (or of its first `max_bytes`).
+    `blake2b` is as fast or faster than `md5` on 64-bit CPUs; the `xxhash` algorithms
+    (see `available_hash_algorithms`) are much faster still, but not cryptographic
+    """
+    h = _new_hasher(algorithm)
+    with open(path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if max_bytes is None and size >= _MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                for i in range(0, size, chunk_size):
+                    h.update(view[i : i + chunk_size])
+                view.release()
+            return h.hexdigest()
+
+        remaining = size if max_bytes is None else min(size, max_bytes)
+        buf = bytearray(min(chunk_size, max(remaining, 1)))
+        view = memoryview(buf)
+        while remaining > 0:
+            n = f.readinto(view[: min(len(buf), remaining)])
+            if not n:
+                break
+            h.update(view[:n])
+            remaining -= n
+    return h.hexdigest()
+
+
+class HashCache:
+    """
+    On-disk cache of file digests, stored in a SQLite database.
+
+    Digests are keyed by (path, algorithm) and stored with the file's size and
+    `mtime_ns`; a cached digest is only used if both still match, so re-hashing
+    unchanged files costs a single `stat`. Use with `hash_files(..., cache=...)`
+    """
+
+    def __init__(self, path: PathLike = DEFAULT_HASH_CACHE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes (path TEXT, algorithm TEXT, size INTEGER, "
+            "mtime_ns INTEGER, digest TEXT, PRIMARY KEY (path, algorithm))"
+        )
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str, algorithm: str, st: os.stat_result) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, digest FROM hashes WHERE path = ? AND algorithm = ?",
+                (path, algorithm),
+            ).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            self.hits += 1
+            return row[2]
+        self.misses += 1
+        return None
+
+    def set(self, path: str, algorithm: str, st: os.stat_result, digest: str):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+                (path, algorithm, st.st_size, st.st_mtime_ns, digest),
+            )
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path})"
+
+
+def _resolve_hash_cache(cache: Union[bool, PathLike, HashCache, None]) -> Optional[HashCache]:
+    if cache is None or cache is False: return None
+    if cache is True:                   return HashCache()
+    if isinstance(cache, HashCache):    return cache
+    return HashCache(cache)
+
+
+def hash_files(
+    files: Iterable[PathLike],
+    algorithm: str = "blake2b",
+    workers: int = 8,
+    cache: Union[bool, PathLike, HashCache, None] = None,
+    max_bytes: Optional[int] = None,
+    verbose: bool = True,
+) -> Dict[PathLike, Optional[str]]:
+    """
+    Hash `files` on a pool of `workers` threads (hashing releases the GIL) and return
+    a `{file: hex digest}` dict. Files that can't be read get a `None` digest.
+
+    Pass `cache` (`True` for the default location, a path to a SQLite file, or a
+    `HashCache`) to skip files that haven't changed since they were last hashed.
+    With `max_bytes`, only the first `max_bytes` of each file are hashed
+    """
+    _new_hasher(algorithm)  # Fail early on unknown algorithms
+    files = list(files)
+    hash_cache = _resolve_hash_cache(cache)
+    cache_key = algorithm if max_bytes is None else f"{algorithm}:{max_bytes}"
+
+    def _hash(f) -> Optional[str]:
+        try:
+            if hash_cache is None:
+                return hash_file(f, algorithm, max_bytes=max_bytes)
+
+            path = os.path.abspath(f)
+            st = os.stat(path)
+            digest = hash_cache.get(path, cache_key, st)
+            if digest is None:
+                digest = hash_file(path, algorithm, max_bytes=max_bytes)
+                hash_cache.set(path, cache_key, st, digest)
+            return digest
+        except OSError as e:
+            logger.warning(f"Failed to hash {f}: {e}")
+            return None
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            digests = list(tqdm(
+                executor.map(_hash, files), total=len(files), desc="Hashing files", disable=not verbose
+            ))
+    finally:
+        if hash_cache is not None:
+            # Only close connections that we opened here
+            if isinstance(cache, HashCache): hash_cache.commit()
+            else:                            hash_cache.close()
+
+    return dict(zip(files, digests))
+
+
+def _group_by(files: list, keys: list, group_filter: Optional[Callable[[list], bool]] = None) -> List[list]:
+    "Group `files` by `keys`, keeping only groups with more than one file (that pass `group_filter`)"
+    groups = defaultdict(list)
+    for f, k in zip(files, keys):
+        if k is not None:
+            groups[k].append(f)
+    return [g for g in groups.values() if len(g) > 1 and (group_filter is None or group_filter(g))]
+
+
+def find_duplicate_files(
+    files: Iterable[Union[PathLike, os.DirEntry]],
+    algorithm: str = "blake2b",
+    workers: int = 8,
+    partial_bytes: int = 64 * 1024,
+    cache: Union[bool, PathLike, HashCache, None] = None,
+    verbose: bool = True,
+    group_filter: Optional[Callable[[list], bool]] = None,
+) -> List[list]:
+    """
+    Return groups of files with identical contents. Files are grouped by size first,
+    then by a hash of their first `partial_bytes` and finally by a full hash, only
+    hashing files that still collide with another, so the cost scales with the
+    no. of same-size files rather than the total no. of bytes.
+    `os.DirEntry`s (e.g. from `get_files(..., return_type="entry")`) reuse their `stat`
+
+    `group_filter(group)` is applied after every step, so that groups which can't
+    matter to the caller (e.g. with no file from some folder) are never hashed
+    """
+    files = list(files)
+
+    def size(f) -> Optional[int]:
+        try:
+            return f.stat().st_size if isinstance(f, os.DirEntry) else os.stat(f).st_size
+        except OSError:
+            return None
+
+    def split_by_hash(groups: List[list], max_bytes: Optional[int]) -> List[list]:
+        digests = hash_files(
+            [os.fspath(f) for g in groups for f in g], algorithm, workers, hash_cache, max_bytes, verbose
+        )
+        return [dup for g in groups for dup in _group_by(g, [digests[os.fspath(f)] for f in g], group_filter)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        sizes = list(executor.map(size, files))
+    size_of = {id(f): s for f, s in zip(files, sizes)}
+
+    hash_cache = _resolve_hash_cache(cache)
+    try:
+        # Hashing the start of a file is enough to tell most same-size files apart
+        groups = split_by_hash(_group_by(files, sizes, group_filter), partial_bytes)
+
+        # Files no bigger than `partial_bytes` have already been hashed in full
+        done = [g for g in groups if size_of[id(g[0])] <= partial_bytes]
+        todo = [g for g in groups if size_of[id(g[0])] > partial_bytes]
+        return done + split_by_hash(todo, None)
+    finally:
+        if hash_cache is not None:
+            if isinstance(cache, HashCache): hash_cache.commit()
+            else:                            hash_cache.close()